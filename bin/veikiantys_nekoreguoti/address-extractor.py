@@ -1,14 +1,26 @@
 import os
+import sys
 import csv
 import re
+import gzip
+import hashlib
+import json
+import logging
 import time
+import queue
+import threading
 import requests
 from bs4 import BeautifulSoup
 from pathlib import Path
+from datetime import datetime
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Per-request details are logged at DEBUG, set LOG_LEVEL=DEBUG to see them
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper(), format="%(message)s")
+log = logging.getLogger("address-extractor")
+
 # ===== Config =====
 ETAPAS_DIR = os.environ.get("DIR_ETAPAS")
 if not ETAPAS_DIR:
@@ -19,14 +31,43 @@ INPUT_FILE = Path(ETAPAS_DIR) / ETAPAS_FILENAME
 
 MOCK_EXTRACTION = os.environ.get("MOCK_EXTRACTION", "FALSE").upper() == "TRUE"
 
+# Optional folder where every raw registry response is kept (gzip compressed)
+ARCHIVE_DIR = os.environ.get("RC_ARCHIVE_DIR")
+
+# --reparse: rebuild addresses from the archive without any requests to the registry
+REPARSE = "--reparse" in sys.argv
+if REPARSE and not ARCHIVE_DIR:
+    raise RuntimeError("--reparse needs RC_ARCHIVE_DIR to point at the response archive.")
+
 URL = "https://mgvdisisorinis.registrucentras.lt/ivn/paieska-pagal-asmeni"
 
-COOKIE = os.environ.get("RC_COOKIE", "")
-if not COOKIE and not MOCK_EXTRACTION:
-    raise RuntimeError("Environment variable RC_COOKIE is not set.")
+def get_cookies():
+    """Get all cookies listed in RC_COOKIE_X environment variables (any X), falling back to RC_COOKIE."""
+    cookies = []
+    pattern = re.compile(r"^RC_COOKIE_(\d+)$")
+    for key, value in os.environ.items():
+        if pattern.match(key) and value:
+            cookies.append((int(pattern.match(key).group(1)), key, value))
+    # Sort by number for predictable order
+    cookies.sort()
+    if not cookies and os.environ.get("RC_COOKIE"):
+        return [("RC_COOKIE", os.environ["RC_COOKIE"])]
+    return [(key, value) for _, key, value in cookies]
+
+COOKIES = get_cookies()
+if not COOKIES and not MOCK_EXTRACTION and not REPARSE:
+    raise RuntimeError("Environment variable RC_COOKIE (or RC_COOKIE_1..N) is not set.")
+
+# Minimum pause between two requests made with the same session
+RATE_LIMIT_SECONDS = float(os.environ.get("RC_RATE_LIMIT_SECONDS", "2"))
+
+# How long one registry request may take before it is given up as a request error
+TIMEOUT_SECONDS = float(os.environ.get("RC_TIMEOUT_SECONDS", "30"))
+
+# Optional run summary export: *.json for JSON, anything else for Prometheus text format
+METRICS_FILE = os.environ.get("RC_METRICS_FILE")
 
 HEADERS = {
-    "Cookie": COOKIE,
     "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
     "Content-Type": "application/x-www-form-urlencoded"
 }
@@ -72,34 +113,360 @@ def mock_address(vardas, pavarde):
     """Generate a mock address for testing."""
     return f"Mock adresas {vardas} {pavarde}", "LT-12345"
 
-# ===== Main =====
-def main():
-    if not Path(INPUT_FILE).exists():
-        print(f"Error: File {INPUT_FILE} not found.")
-        exit(1)
+# ===== Response Archive =====
+def archive_stem(person_key):
+    """Build a filesystem-safe file name prefix that is unique per person key."""
+    slug = re.sub(r"\W+", "_", "_".join(person_key)).strip("_")
+    digest = hashlib.sha1("\x1f".join(person_key).encode("utf-8")).hexdigest()[:8]
+    return f"{slug}_{digest}"
 
-    print(f"Processing file: {INPUT_FILE}")
-    
-    if MOCK_EXTRACTION:
-        print("MOCK MODE: No actual API calls will be made to Registru Centras.")
-        print("This will only log what would be extracted.")
+def archive_response(person_key, html):
+    """Store a raw response body in the archive, keyed by person key and timestamp."""
+    stamp = datetime.now().strftime("%Y%m%dT%H%M%S%f")
+    archive_path = Path(ARCHIVE_DIR) / f"{archive_stem(person_key)}_{stamp}.html.gz"
+    with gzip.open(archive_path, "wt", encoding="utf-8") as f:
+        f.write(html)
 
-    # First, identify all unique individuals that need addresses
-    unique_individuals = {}  # (vardas, pavarde, gim_data) -> row indices
-    updated_rows = []
-    
-    with open(INPUT_FILE, newline="", encoding="utf-8-sig") as csvfile:
-        reader = csv.reader(csvfile)
-        rows = list(reader)
-        
-    # Keep the header
-    header = rows[0]
-    updated_rows.append(header)
-    
-    # Find all unique individuals and track their row indices
+def index_archive():
+    """List the archive once: {archive stem: path of its newest response}."""
+    newest = {}
+    if not Path(ARCHIVE_DIR).is_dir():
+        return newest
+    suffix = ".html.gz"
+    with os.scandir(ARCHIVE_DIR) as entries:
+        for entry in entries:
+            if not entry.name.endswith(suffix):
+                continue
+            # timestamps have no underscores and sort chronologically
+            stem = entry.name[:-len(suffix)].rsplit("_", 1)[0]
+            if stem not in newest or entry.name > Path(newest[stem]).name:
+                newest[stem] = entry.path
+    return newest
+
+def load_archived_response(person_key, archive_index):
+    """Return the newest archived response body for a person key, or None if there is none."""
+    path = archive_index.get(archive_stem(person_key))
+    if path is None:
+        return None
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return f.read()
+
+# ===== Session Pool =====
+class RegistrySession:
+    """One authenticated Registru Centras session with its own rate limit."""
+
+    def __init__(self, name, cookie, min_interval=RATE_LIMIT_SECONDS, timeout=TIMEOUT_SECONDS):
+        self.name = name
+        self.http = requests.Session()
+        self.http.headers.update(HEADERS)
+        self.http.headers["Cookie"] = cookie
+        self.min_interval = min_interval
+        self.timeout = timeout
+        self._next_request_at = 0.0
+
+    def wait_turn(self):
+        """Sleep until this session's rate limit allows the next request."""
+        wait = self._next_request_at - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+
+    def post(self, payload):
+        """Send a search request."""
+        try:
+            return self.http.post(URL, data=payload, timeout=self.timeout)
+        finally:
+            self._next_request_at = time.monotonic() + self.min_interval
+
+LOGIN_MARKERS = ("login", "prisijung")
+
+def is_login_form(form):
+    """A form is the login form if it posts to the login endpoint or asks for a password itself.
+
+    Forms in the page header or navigation (e.g. a login widget) belong to the layout and never count.
+    """
+    if form.find_parent(["header", "nav"]):
+        return False
+    action = (form.get("action") or "").lower()
+    if any(marker in action for marker in LOGIN_MARKERS):
+        return True
+    return form.find("input", type="password") is not None
+
+def is_login_page(response):
+    """Detect an expired session: the registry answers with its login page instead of results.
+
+    401/403 and a redirect to the login URL always count. A 200 page only counts when it has no
+    results section and contains the login form itself, so a login widget in the header of a
+    results page does not take the session out of rotation.
+    """
+    if response.status_code in (401, 403):
+        return True
+    final_url = response.url.lower()
+    if any(marker in final_url for marker in LOGIN_MARKERS):
+        return True
+    if response.status_code != 200:
+        return False
+    text = response.text
+    lowered = text.lower()
+    # cheap check first, most results pages never need a second parse
+    if "password" not in lowered and not any(marker in lowered for marker in LOGIN_MARKERS):
+        return False
+    soup = BeautifulSoup(text, "html.parser")
+    if soup.find(string=re.compile(r"Deklaravo gyvenamąją vietą:")):
+        return False
+    return any(is_login_form(form) for form in soup.find_all("form"))
+
+class LookupFailed(Exception):
+    """A lookup got no usable answer (request error or non-200 status), the person stays unresolved."""
+
+def lookup_person(session, person_key, registro_nr, metrics=None):
+    """Look up one person's address. Returns None if the session turned out to be expired.
+
+    Raises LookupFailed on a request error or a non-200 response, so the person's existing
+    address is never overwritten with blanks.
+    """
+    vardas, pavarde, gim_data = person_key
+    payload = build_payload(registro_nr, vardas, pavarde, gim_data)
+
+    log.debug(f"\n[{session.name}] Making request for: {vardas} {pavarde} ({gim_data})")
+    log.debug(f"URL: {URL}")
+    log.debug(f"Payload: {payload}")
+
+    session.wait_turn()
+    started = time.perf_counter()
+    try:
+        response = session.post(payload)
+    except requests.RequestException as e:
+        log.warning(f"Failed to extract for {vardas} {pavarde}. Request error: {e}")
+        if metrics:
+            metrics.record(session.name, time.perf_counter() - started, "error")
+        raise LookupFailed(f"request error: {e}") from e
+    latency = time.perf_counter() - started
+
+    log.debug(f"Response status: {response.status_code}")
+
+    if is_login_page(response):
+        if metrics:
+            metrics.record(session.name, latency, "login", len(response.content))
+        return None
+
+    if response.status_code != 200:
+        log.warning(f"Failed to extract for {vardas} {pavarde}. Status code: {response.status_code}")
+        if metrics:
+            metrics.record(session.name, latency, response.status_code, len(response.content))
+        raise LookupFailed(f"status code {response.status_code}")
+
+    if ARCHIVE_DIR:
+        archive_response(person_key, response.text)
+    parse_started = time.perf_counter()
+    address, postal_code = extract_address(response.text)
+    parse_time = time.perf_counter() - parse_started
+    log.debug(f"Extracted for {vardas} {pavarde}: {address}, {postal_code}")
+
+    if metrics:
+        metrics.record(session.name, latency, response.status_code, len(response.content), parse_time, bool(address))
+    return address, postal_code
+
+def lookup_addresses(people, sessions, on_result=None, metrics=None):
+    """Spread (person_key, registro_nr) lookups across sessions, one worker thread per session.
+
+    Expired sessions are taken out of rotation and their person goes back to the queue.
+    A person whose lookup fails (LookupFailed) or whose lookup or on_result call raises any
+    other error is logged and left unresolved (an address found before on_result failed stays in the cache).
+    Returns the resolved addresses and the people left unresolved (failed, or left over
+    because every session expired).
+    """
+    work = queue.Queue()
+    for item in people:
+        work.put(item)
+
+    cache = {}
+    failed = []
+    lock = threading.Lock()
+    outstanding = [work.qsize()]
+
+    def worker(session):
+        while True:
+            try:
+                person_key, registro_nr = work.get(timeout=0.2)
+            except queue.Empty:
+                with lock:
+                    if outstanding[0] == 0:
+                        return
+                continue
+
+            requeued = False
+            try:
+                result = lookup_person(session, person_key, registro_nr, metrics)
+                if result is None:
+                    work.put((person_key, registro_nr))
+                    requeued = True
+                    log.warning(f"Session {session.name} has expired (login page returned), taking it out of rotation")
+                    return
+
+                with lock:
+                    cache[person_key] = result
+                if on_result:
+                    on_result(person_key, *result)
+            except LookupFailed:
+                # already logged by lookup_person
+                with lock:
+                    failed.append(person_key)
+            except Exception as e:
+                # an unexpected error must not stop this session's thread, or the pool never finishes
+                vardas, pavarde, _ = person_key
+                log.error(f"[{session.name}] Lookup failed for {vardas} {pavarde}: {type(e).__name__}: {e}")
+                with lock:
+                    failed.append(person_key)
+            finally:
+                if not requeued:
+                    with lock:
+                        outstanding[0] -= 1
+
+    threads = [threading.Thread(target=worker, args=(session,), daemon=True) for session in sessions]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    unresolved = list(failed)
+    while not work.empty():
+        unresolved.append(work.get_nowait()[0])
+    return cache, unresolved
+
+# ===== Telemetry =====
+LATENCY_BUCKETS = (0.25, 0.5, 1, 2, 5, 10, 30)
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+class LookupMetrics:
+    """Collects per-request metrics from all session threads and summarises the run."""
+
+    def __init__(self):
+        self.records = []
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record(self, session_name, latency, status, size=0, parse_time=0.0, found=False):
+        """Record one registry request."""
+        with self._lock:
+            self.records.append({
+                "session": session_name,
+                "latency": latency,
+                "status": str(status),
+                "bytes": size,
+                "parse_time": parse_time,
+                "found": found
+            })
+
+    def summary(self):
+        """Aggregate the recorded requests into a run summary."""
+        with self._lock:
+            records = list(self.records)
+        elapsed = time.monotonic() - self.started
+        latencies = sorted(r["latency"] for r in records)
+        ok = [r for r in records if r["status"] == "200"]
+
+        statuses = {}
+        sessions = {}
+        for r in records:
+            statuses[r["status"]] = statuses.get(r["status"], 0) + 1
+            sessions[r["session"]] = sessions.get(r["session"], 0) + 1
+
+        histogram = {str(b): sum(1 for x in latencies if x <= b) for b in LATENCY_BUCKETS}
+        histogram["+Inf"] = len(latencies)
+
+        return {
+            "requests": len(records),
+            "elapsed_seconds": round(elapsed, 3),
+            "requests_per_minute": round(len(records) / elapsed * 60, 2) if elapsed > 0 else 0.0,
+            "latency_seconds": {
+                "p50": round(percentile(latencies, 50), 4),
+                "p95": round(percentile(latencies, 95), 4),
+                "p99": round(percentile(latencies, 99), 4),
+                "sum": round(sum(latencies), 4),
+                "histogram": histogram
+            },
+            "parse_seconds_total": round(sum(r["parse_time"] for r in records), 4),
+            "bytes_total": sum(r["bytes"] for r in records),
+            "status_codes": statuses,
+            "requests_per_session": sessions,
+            "addresses_found": sum(1 for r in ok if r["found"]),
+            "hit_rate": round(sum(1 for r in ok if r["found"]) / len(ok), 4) if ok else 0.0,
+            "success_rate": round(len(ok) / len(records), 4) if records else 0.0
+        }
+
+    def print_summary(self):
+        """Print a short human readable run summary."""
+        summary = self.summary()
+        latency = summary["latency_seconds"]
+        print("\nLookup summary:")
+        print(f"  Requests: {summary['requests']} in {summary['elapsed_seconds']}s ({summary['requests_per_minute']} requests/min)")
+        print(f"  Latency p50/p95/p99: {latency['p50']}s / {latency['p95']}s / {latency['p99']}s")
+        print(f"  Status codes: {summary['status_codes']}")
+        print(f"  Addresses found: {summary['addresses_found']} (hit rate {summary['hit_rate']:.0%}, success rate {summary['success_rate']:.0%})")
+        print(f"  Bytes received: {summary['bytes_total']}, parse time: {summary['parse_seconds_total']}s")
+        for session_name, count in summary["requests_per_session"].items():
+            print(f"  Requests made to website with {session_name}: {count}")
+
+    def export(self, path):
+        """Write the run summary as JSON (*.json) or as a Prometheus text file (anything else)."""
+        summary = self.summary()
+        path = Path(path)
+        if path.suffix.lower() == ".json":
+            path.write_text(json.dumps(summary, indent=2, ensure_ascii=False), encoding="utf-8")
+            return
+
+        latency = summary["latency_seconds"]
+        lines = [
+            "# HELP rc_lookup_latency_seconds Registry request latency.",
+            "# TYPE rc_lookup_latency_seconds histogram"
+        ]
+        for bucket, count in latency["histogram"].items():
+            lines.append(f'rc_lookup_latency_seconds_bucket{{le="{bucket}"}} {count}')
+        lines.append(f"rc_lookup_latency_seconds_sum {latency['sum']}")
+        lines.append(f"rc_lookup_latency_seconds_count {summary['requests']}")
+        lines.append("# HELP rc_lookup_latency_quantile_seconds Registry request latency percentiles.")
+        lines.append("# TYPE rc_lookup_latency_quantile_seconds gauge")
+        for name, quantile in (("p50", "0.5"), ("p95", "0.95"), ("p99", "0.99")):
+            lines.append(f'rc_lookup_latency_quantile_seconds{{quantile="{quantile}"}} {latency[name]}')
+        lines.append("# HELP rc_lookup_requests_total Registry requests by status code.")
+        lines.append("# TYPE rc_lookup_requests_total counter")
+        for status, count in summary["status_codes"].items():
+            lines.append(f'rc_lookup_requests_total{{status="{status}"}} {count}')
+        lines.append("# TYPE rc_lookup_response_bytes_total counter")
+        lines.append(f"rc_lookup_response_bytes_total {summary['bytes_total']}")
+        lines.append("# TYPE rc_lookup_parse_seconds_total counter")
+        lines.append(f"rc_lookup_parse_seconds_total {summary['parse_seconds_total']}")
+        lines.append("# TYPE rc_lookup_addresses_found_total counter")
+        lines.append(f"rc_lookup_addresses_found_total {summary['addresses_found']}")
+        lines.append("# TYPE rc_lookup_requests_per_minute gauge")
+        lines.append(f"rc_lookup_requests_per_minute {summary['requests_per_minute']}")
+        lines.append("# TYPE rc_lookup_hit_rate gauge")
+        lines.append(f"rc_lookup_hit_rate {summary['hit_rate']}")
+        path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+# ===== CSV Rows =====
+def read_rows(input_file, delimiter=","):
+    """Read all rows (header included) of the aggregated CSV."""
+    with open(input_file, newline="", encoding="utf-8-sig") as csvfile:
+        return list(csv.reader(csvfile, delimiter=delimiter))
+
+def write_rows(output_file, rows, delimiter=","):
+    """Write all rows (header included) back to the aggregated CSV."""
+    with open(output_file, "w", newline="", encoding="utf-8-sig") as outcsv:
+        writer = csv.writer(outcsv, delimiter=delimiter)
+        writer.writerows(rows)
+
+def find_unique_individuals(rows):
+    """Map each unique individual (vardas, pavarde, gim_data) to the indices of their rows."""
+    unique_individuals = {}
     for i, row in enumerate(rows[1:], 1):  # Skip header row
         if len(row) < 12:  # Not enough columns
-            updated_rows.append(row)
             continue
         
         vardas = row[5]
@@ -112,85 +479,114 @@ def main():
             if person_key not in unique_individuals:
                 unique_individuals[person_key] = []
             unique_individuals[person_key].append(i)
-    
-    print(f"Found {len(unique_individuals)} unique individuals requiring address lookup")
-    
-    # Now process each unique individual once
+    return unique_individuals
+
+def apply_address(row, address, postal_code):
+    """Write address and postal code into columns 12-13 of a row, in place."""
+    # Always overwrite address and postal code
+    if len(row) >= 14:
+        row[12] = address
+        row[13] = postal_code
+    else:
+        row[:] = row[:12] + [address, postal_code]
+
+def resolve_addresses(unique_individuals, rows, on_result=None):
+    """Resolve addresses in the configured mode: reparse from archive, mock or live lookups.
+
+    on_result(person_key, address, postal_code) is called as soon as each person is resolved.
+    Returns the resolved addresses, the people left unresolved and the lookup metrics (live mode only).
+    """
     cache = {}
-    request_count = 0
-    
-    for person_key, row_indices in unique_individuals.items():
-        vardas, pavarde, gim_data = person_key
-        
-        if MOCK_EXTRACTION:
+    unresolved = []
+    metrics = None
+
+    if REPARSE:
+        archive_index = index_archive()
+        for person_key in unique_individuals:
+            html = load_archived_response(person_key, archive_index)
+            if html is None:
+                unresolved.append(person_key)
+                continue
+            cache[person_key] = extract_address(html)
+            if on_result:
+                on_result(person_key, *cache[person_key])
+    elif MOCK_EXTRACTION:
+        for person_key in unique_individuals:
+            vardas, pavarde, gim_data = person_key
             address, postal_code = mock_address(vardas, pavarde)
             print(f"MOCK: Would extract address for {vardas} {pavarde}, {gim_data}")
             print(f"MOCK: Would return: {address}, {postal_code}")
-        else:
-            registro_nr = rows[row_indices[0]][0]  # Use registro_nr from first occurrence
-            
-            payload = build_payload(registro_nr, vardas, pavarde, gim_data)
-            
-            # Add detailed debug information before the request
-            print(f"\nMaking request for: {vardas} {pavarde} ({gim_data})")
-            print(f"URL: {URL}")
-            print(f"Payload: {payload}")
-            
-            response = requests.post(URL, headers=HEADERS, data=payload)
-            request_count += 1
-            
-            print(f"Response status: {response.status_code}")
-            
-            if response.status_code == 200:
-                address, postal_code = extract_address(response.text)
-                print(f"Extracted for {vardas} {pavarde}: {address}, {postal_code}")
-            else:
-                address, postal_code = "", ""
-                print(f"Failed to extract for {vardas} {pavarde}. Status code: {response.status_code}")
-            time.sleep(2)  # Prevent rate limiting
-        
-        cache[person_key] = (address, postal_code)
+            cache[person_key] = (address, postal_code)
+            if on_result:
+                on_result(person_key, address, postal_code)
+    else:
+        if ARCHIVE_DIR:
+            Path(ARCHIVE_DIR).mkdir(parents=True, exist_ok=True)
+        sessions = [RegistrySession(name, cookie) for name, cookie in COOKIES]
+        print(f"Using {len(sessions)} session(s), {RATE_LIMIT_SECONDS}s between requests per session")
+
+        # Use registro_nr from first occurrence
+        people = [(person_key, rows[row_indices[0]][0]) for person_key, row_indices in unique_individuals.items()]
+        metrics = LookupMetrics()
+        cache, unresolved = lookup_addresses(people, sessions, on_result, metrics)
+
+    return cache, unresolved, metrics
+
+def print_lookup_report(cache, unresolved, metrics):
+    """Print the mode specific end-of-run report."""
+    if REPARSE:
+        print(f"Addresses rebuilt from archive: {len(cache)}")
+        if unresolved:
+            print(f"WARNING: {len(unresolved)} individuals have no archived response, their rows were left unchanged.")
+    elif MOCK_EXTRACTION:
+        print("MOCK MODE: File was updated with mock address values for testing.")
+    else:
+        metrics.print_summary()
+        if METRICS_FILE:
+            metrics.export(METRICS_FILE)
+            print(f"Lookup metrics written to: {METRICS_FILE}")
+        if unresolved:
+            print(f"WARNING: {len(unresolved)} individuals were left unresolved (lookup errors or all sessions expired).")
+            print("Their rows were left unchanged - check the log, refresh the cookies if needed and run again.")
+
+def print_mode_banner():
+    """Print which lookup mode is active."""
+    if REPARSE:
+        print(f"REPARSE MODE: Addresses are rebuilt from the archive in {ARCHIVE_DIR}, no requests are made.")
+    elif MOCK_EXTRACTION:
+        print("MOCK MODE: No actual API calls will be made to Registru Centras.")
+        print("This will only log what would be extracted.")
+
+# ===== Main =====
+def main():
+    if not Path(INPUT_FILE).exists():
+        print(f"Error: File {INPUT_FILE} not found.")
+        exit(1)
+
+    print(f"Processing file: {INPUT_FILE}")
+    print_mode_banner()
+
+    # First, identify all unique individuals that need addresses
+    rows = read_rows(INPUT_FILE)
+    unique_individuals = find_unique_individuals(rows)
+    print(f"Found {len(unique_individuals)} unique individuals requiring address lookup")
+    
+    # Now process each unique individual once
+    cache, unresolved, metrics = resolve_addresses(unique_individuals, rows)
     
     # Now apply cached results to all rows
-    for i, row in enumerate(rows[1:], 1):  # Skip header row
-        if len(row) < 12:  # Not enough columns
-            continue
-            
-        vardas = row[5]
-        pavarde = row[6]
-        gim_data = row[7]
-        tipas = row[8]
-        
-        if tipas.lower() == "fizinis":
-            person_key = (vardas, pavarde, gim_data)
-            if person_key in cache:
-                address, postal_code = cache[person_key]
-                
-                # Ensure row is long enough
-                while len(row) < 12:
-                    row.append("")
-                
-                # Always overwrite address and postal code
-                if len(row) >= 14:
-                    row[12] = address
-                    row[13] = postal_code
-                else:
-                    row = row[:12] + [address, postal_code]
-
-        updated_rows.append(row)
+    for person_key, row_indices in unique_individuals.items():
+        if person_key in cache:
+            for i in row_indices:
+                apply_address(rows[i], *cache[person_key])
 
     # Modified part: Always write to file, even in MOCK mode
-    with open(INPUT_FILE, "w", newline="", encoding="utf-8-sig") as outcsv:
-        writer = csv.writer(outcsv)
-        writer.writerows(updated_rows)
+    write_rows(INPUT_FILE, rows)
 
     print(f"File updated: {INPUT_FILE}")
-    if MOCK_EXTRACTION:
-        print("MOCK MODE: File was updated with mock address values for testing.")
-    else:
-        print(f"Requests made to website: {request_count}")
+    print_lookup_report(cache, unresolved, metrics)
     print(f"Unique individuals processed: {len(cache)}")
     print(f"Total individuals in file: {len(unique_individuals)}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
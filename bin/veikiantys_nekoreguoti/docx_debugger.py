@@ -1,133 +1,541 @@
 from pathlib import Path
 from docx import Document
+from docx.opc.constants import CONTENT_TYPE as CT
+from docx.oxml.ns import qn
+from docx.text.paragraph import Paragraph
+from docx.text.run import Run
 from dotenv import load_dotenv
+from bisect import bisect_left
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import json
 import os
 import sys
 
 load_dotenv()
 
-def print_doc_structure(doc_path):
-    """Print the structure and content of a .docx file to the terminal."""
+# graphicData uri -> drawing type
+DRAWING_TYPES = {
+    "http://schemas.openxmlformats.org/drawingml/2006/picture": "Picture",
+    "http://schemas.openxmlformats.org/drawingml/2006/chart": "Chart",
+    "http://schemas.openxmlformats.org/drawingml/2006/diagram": "Smart Art",
+    "http://schemas.openxmlformats.org/presentationml/2006/ole": "Embedded Object",
+    "http://schemas.microsoft.com/office/word/2010/wordprocessingShape": "Shape",
+    "http://schemas.microsoft.com/office/word/2010/wordprocessingGroup": "Group",
+}
+
+def drawing_info(drawing, location):
+    """Type, placement, size (EMU) and name of one w:drawing element."""
+    frame = drawing[0] if len(drawing) else None
+    extent = frame.find(qn("wp:extent")) if frame is not None else None
+    doc_pr = frame.find(qn("wp:docPr")) if frame is not None else None
+    graphic_data = drawing.find(f".//{qn('a:graphicData')}")
+    uri = graphic_data.get("uri") if graphic_data is not None else None
+    return {
+        "type": DRAWING_TYPES.get(uri, "Unknown"),
+        "placement": "inline" if frame is not None and frame.tag == qn("wp:inline") else "floating",
+        "width": int(extent.get("cx")) if extent is not None else None,
+        "height": int(extent.get("cy")) if extent is not None else None,
+        "name": doc_pr.get("name") if doc_pr is not None else None,
+        "location": location,
+    }
+
+def run_info(run):
+    """Text and formatting of one run."""
+    font = run.font
+    return {
+        "text": run.text,
+        "bold": run.bold,
+        "italic": run.italic,
+        "underline": bool(run.underline) if run.underline is not None else None,
+        "font": font.name,
+        "size": font.size.pt if font.size is not None else None,
+    }
+
+def paragraph_info(p, parent, index, drawings, location):
+    """Text, style, numbering and runs of one paragraph; its drawings are appended to `drawings`."""
+    para = Paragraph(p, parent)
+    p_pr = p.pPr
+    num_pr = p_pr.numPr if p_pr is not None else None
+    numbering = None
+    if num_pr is not None:
+        numbering = {
+            "numId": num_pr.numId.val if num_pr.numId is not None else None,
+            "ilvl": num_pr.ilvl.val if num_pr.ilvl is not None else None,
+        }
+    info = {
+        "index": index,
+        "text": para.text,
+        "style": p.style,
+        "numbering": numbering,
+        "runs": [run_info(Run(r, para)) for r in p.iterchildren(qn("w:r"))],
+        "drawings": [],
+        "location": location,
+    }
+    for drawing in p.iter(qn("w:drawing")):
+        info["drawings"].append(len(drawings))
+        drawings.append(drawing_info(drawing, dict(location, paragraph=index)))
+    return info
+
+def block_drawings(element, drawings, location):
+    """Append the drawings of a block that is neither a paragraph nor a table (e.g. a w:sdt content control)."""
+    container = element.tag.rsplit("}", 1)[-1]
+    for drawing in element.iter(qn("w:drawing")):
+        drawings.append(drawing_info(drawing, dict(location, container=container)))
+
+def index_document(doc):
+    """Walk the body once and record paragraphs, runs, tables and drawings with their positions.
+
+    Body paragraphs are numbered like doc.paragraphs (from 1); table cell paragraphs are kept
+    with their table, row and column. Drawings in other blocks (content controls, ...) and in
+    headers and footers are listed as well.
+    """
+    # body: ("paragraph" | "table", number) of every top-level block, in document order
+    index = {"paragraphs": [], "tables": [], "drawings": [], "body": []}
+    drawings = index["drawings"]
+    body = doc._body
+
+    def walk_table(tbl, location):
+        table_number = len(index["tables"]) + 1
+        grid = tbl.find(qn("w:tblGrid"))
+        table = {
+            "index": table_number,
+            "location": location,
+            "rows": 0,
+            "columns": len(grid.findall(qn("w:gridCol"))) if grid is not None else 0,
+            "cells": [],
+        }
+        index["tables"].append(table)
+        for row_number, tr in enumerate(tbl.iterchildren(qn("w:tr")), start=1):
+            table["rows"] = row_number
+            for col_number, tc in enumerate(tr.iterchildren(qn("w:tc")), start=1):
+                cell_location = {"table": table_number, "row": row_number, "column": col_number}
+                cell = dict(cell_location, paragraphs=[])
+                for child in tc:
+                    if child.tag == qn("w:p"):
+                        number = len(cell["paragraphs"]) + 1
+                        cell["paragraphs"].append(paragraph_info(child, body, number, drawings, cell_location))
+                    elif child.tag == qn("w:tbl"):
+                        walk_table(child, cell_location)
+                    else:
+                        block_drawings(child, drawings, cell_location)
+                cell["text"] = "\n".join(para["text"] for para in cell["paragraphs"])
+                table["cells"].append(cell)
+
+    for child in doc.element.body:
+        if child.tag == qn("w:p"):
+            number = len(index["paragraphs"]) + 1
+            index["paragraphs"].append(paragraph_info(child, body, number, drawings, {"body": True}))
+            index["body"].append(("paragraph", number))
+        elif child.tag == qn("w:tbl"):
+            index["body"].append(("table", len(index["tables"]) + 1))
+            walk_table(child, {"body": True})
+        else:
+            block_drawings(child, drawings, {"body": True})
+
+    for part in doc.part.package.iter_parts():
+        if part.content_type in (CT.WML_HEADER, CT.WML_FOOTER):
+            for drawing in part.element.iter(qn("w:drawing")):
+                drawings.append(drawing_info(drawing, {"part": part.partname.membername}))
+
+    return index
+
+def describe_location(location):
+    """Human readable position of a drawing."""
+    if "part" in location:
+        return f"in {location['part']}"
+    if "container" in location:
+        where = f" in table {location['table']} cell [{location['row']},{location['column']}]" if "table" in location else ""
+        return f"in a w:{location['container']} block{where}"
+    if "table" in location:
+        return (f"in table {location['table']} cell [{location['row']},{location['column']}], "
+                f"paragraph {location['paragraph']}")
+    return f"in paragraph #{location['paragraph']}"
+
+def print_index(doc_path, index):
+    """Print a document index like the original text dump."""
     print(f"{'='*50}")
     print(f"DOCUMENT: {doc_path}")
     print(f"{'='*50}")
-    
-    try:
-        doc = Document(doc_path)
-    except Exception as e:
-        print(f"ERROR opening document: {e}")
-        return
-    
+
     # Print document paragraphs
     print("\nPARAGRAPHS:")
     print(f"{'-'*50}")
-    for i, para in enumerate(doc.paragraphs):
-        if para.text.strip():  # Only print non-empty paragraphs
-            print(f"Para {i+1}: {para.text}")
-            
+    for para in index["paragraphs"]:
+        if para["text"].strip():  # Only print non-empty paragraphs
+            print(f"Para {para['index']}: {para['text']}")
+
             # Show run information for debugging formatting
-            if len(para.runs) > 1:
-                print(f"  - Contains {len(para.runs)} runs:")
-                for j, run in enumerate(para.runs):
-                    print(f"    Run {j+1}: '{run.text}' [Bold: {run.bold}, Italic: {run.italic}]")
-    
+            if len(para["runs"]) > 1:
+                print(f"  - Contains {len(para['runs'])} runs:")
+                for j, run in enumerate(para["runs"]):
+                    print(f"    Run {j+1}: '{run['text']}' [Bold: {run['bold']}, Italic: {run['italic']}]")
+
     # Print document tables
     print("\nTABLES:")
     print(f"{'-'*50}")
-    for i, table in enumerate(doc.tables):
-        print(f"Table {i+1}: {len(table.rows)} rows x {len(table.columns)} columns")
-        
-        # Print table contents
-        for row_idx, row in enumerate(table.rows):
-            for col_idx, cell in enumerate(row.cells):
-                text = cell.text.replace('\n', ' ')
-                print(f"  Cell [{row_idx+1},{col_idx+1}]: {text}")
-    
-    # Print information about inline shapes (including images)
-    print("\nINLINE SHAPES:")
+    for table in index["tables"]:
+        nested = f" (in table {table['location']['table']})" if "table" in table["location"] else ""
+        print(f"Table {table['index']}: {table['rows']} rows x {table['columns']} columns{nested}")
+        for cell in table["cells"]:
+            text = cell["text"].replace('\n', ' ')
+            print(f"  Cell [{cell['row']},{cell['column']}]: {text}")
+
+    # Drawings of the body, tables, headers and footers
+    print("\nDRAWING OBJECTS:")
     print(f"{'-'*50}")
+    if index["drawings"]:
+        print(f"Found {len(index['drawings'])} drawing objects in document")
+    else:
+        print("No drawing objects found")
+    for i, drawing in enumerate(index["drawings"]):
+        print(f"Drawing {i+1}: Type={drawing['type']} ({drawing['placement']}), "
+              f"Width={drawing['width']}, Height={drawing['height']}, {describe_location(drawing['location'])}")
+
+def print_doc_structure(doc_path, as_json=False):
+    """Print the structure and content of a .docx file to the terminal, as text or JSON."""
     try:
-        if hasattr(doc, 'inline_shapes'):
-            shapes = doc.inline_shapes
-            if shapes:
-                for i, shape in enumerate(shapes):
-                    shape_type = "Unknown"
-                    if shape.type == 1:
-                        shape_type = "Linked Picture"
-                    elif shape.type == 2:
-                        shape_type = "Embedded Picture"
-                    elif shape.type == 3:
-                        shape_type = "Chart"
-                    elif shape.type == 4:
-                        shape_type = "Smart Art"
-                    elif shape.type == 5:
-                        shape_type = "Embedded Object"
-                    
-                    width = shape.width if hasattr(shape, 'width') else "N/A"
-                    height = shape.height if hasattr(shape, 'height') else "N/A"
-                    
-                    print(f"Shape {i+1}: Type={shape_type}, Width={width}, Height={height}")
-            else:
-                print("No inline shapes found")
+        doc = Document(doc_path)
     except Exception as e:
-        print(f"Error checking inline shapes: {e}")
-    
-    # Check for other types of shapes (Drawing objects)
-    print("\nDRAWING OBJECTS:")
-    print(f"{'-'*50}")
+        if as_json:
+            print(json.dumps({"document": str(doc_path), "error": str(e)}, ensure_ascii=False))
+        else:
+            print(f"ERROR opening document: {e}")
+        return
+
+    index = index_document(doc)
+    if as_json:
+        print(json.dumps(dict(document=str(doc_path), **index), ensure_ascii=False, indent=2))
+    else:
+        print_index(doc_path, index)
+
+# ===== Structural diff =====
+
+def body_blocks(index):
+    """Top-level paragraphs and tables of an index in document order.
+
+    Each block has alignment keys from exact to coarse: the full content, then style, numbering
+    and first word (column count for tables), then style and numbering only.
+    """
+    blocks = []
+    for kind, number in index["body"]:
+        if kind == "paragraph":
+            para = index["paragraphs"][number - 1]
+            numbering = tuple(para["numbering"].values()) if para["numbering"] else None
+            words = para["text"].split()
+            keys = (
+                ("p", para["text"]),
+                ("p", para["style"], numbering, words[0] if words else ""),
+                ("p", para["style"], numbering),
+            )
+            blocks.append({"label": f"Para {number}", "keys": keys, "paragraph": para})
+        else:
+            table = index["tables"][number - 1]
+            cells = tuple(cell["text"] for cell in table["cells"])
+            keys = (
+                ("tbl", table["rows"], table["columns"], cells),
+                ("tbl", table["columns"]),
+                ("tbl", table["columns"]),
+            )
+            blocks.append({"label": f"Table {number}", "keys": keys, "table": table})
+    return blocks
+
+def longest_increasing(pairs):
+    """Longest run of (i, j) pairs (sorted by i) whose j increase as well, in O(n log n)."""
+    tails = []
+    tail_pairs = []
+    previous = {}
+    for pair in pairs:
+        k = bisect_left(tails, pair[1])
+        previous[pair] = tail_pairs[k - 1] if k else None
+        if k == len(tails):
+            tails.append(pair[1])
+            tail_pairs.append(pair)
+        else:
+            tails[k] = pair[1]
+            tail_pairs[k] = pair
+    result = []
+    pair = tail_pairs[-1] if tail_pairs else None
+    while pair is not None:
+        result.append(pair)
+        pair = previous[pair]
+    return result[::-1]
+
+def align(a, b):
+    """Align two block sequences given as key levels (a[level][i]). Returns [(i, j)] in order,
+    with None for a block only one side has.
+
+    Patience alignment: common prefix and suffix are matched directly, keys that occur exactly
+    once on both sides anchor the rest, and the gaps between anchors are aligned the same way.
+    A gap without anchors is aligned again on the next, coarser key level, and paired position
+    by position after the last one. Each level runs in O(n log n).
+    """
+    pairs = []
+
+    def walk(a_lo, a_hi, b_lo, b_hi, level):
+        keys_a, keys_b = a[level], b[level]
+        start = []
+        while a_lo < a_hi and b_lo < b_hi and keys_a[a_lo] == keys_b[b_lo]:
+            start.append((a_lo, b_lo))
+            a_lo += 1
+            b_lo += 1
+        end = []
+        while a_lo < a_hi and b_lo < b_hi and keys_a[a_hi - 1] == keys_b[b_hi - 1]:
+            a_hi -= 1
+            b_hi -= 1
+            end.append((a_hi, b_hi))
+        pairs.extend(start)
+
+        counts = defaultdict(lambda: [0, 0, None, None])
+        for i in range(a_lo, a_hi):
+            entry = counts[keys_a[i]]
+            entry[0] += 1
+            entry[2] = i
+        for j in range(b_lo, b_hi):
+            entry = counts[keys_b[j]]
+            entry[1] += 1
+            entry[3] = j
+        anchors = longest_increasing(sorted(
+            (i, j) for count_a, count_b, i, j in counts.values() if count_a == 1 and count_b == 1
+        ))
+
+        if anchors:
+            for i, j in anchors:
+                walk(a_lo, i, b_lo, j, level)
+                pairs.append((i, j))
+                a_lo, b_lo = i + 1, j + 1
+            walk(a_lo, a_hi, b_lo, b_hi, level)
+        elif a_lo < a_hi and b_lo < b_hi and level + 1 < len(a):
+            walk(a_lo, a_hi, b_lo, b_hi, level + 1)
+        else:
+            paired = min(a_hi - a_lo, b_hi - b_lo)
+            pairs.extend((a_lo + k, b_lo + k) for k in range(paired))
+            pairs.extend((i, None) for i in range(a_lo + paired, a_hi))
+            pairs.extend((None, j) for j in range(b_lo + paired, b_hi))
+        pairs.extend(reversed(end))
+
+    walk(0, len(a[0]), 0, len(b[0]), 0)
+    return pairs
+
+def short(text, limit=60):
+    text = text.replace("\n", " ")
+    return repr(text if len(text) <= limit else text[:limit - 3] + "...")
+
+def run_formats(para):
+    return [(run["bold"], run["italic"], run["underline"], run["font"], run["size"]) for run in para["runs"]]
+
+def compare_blocks(old, new):
+    """(kind, detail) of every difference between two aligned blocks."""
+    if ("paragraph" in old) != ("paragraph" in new):
+        return [("replaced", f"{old['label']} -> {new['label']}")]
+
+    changes = []
+    if "table" in old:
+        old_table, new_table = old["table"], new["table"]
+        if (old_table["rows"], old_table["columns"]) != (new_table["rows"], new_table["columns"]):
+            changes.append(("table shape", f"{old_table['rows']}x{old_table['columns']} -> {new_table['rows']}x{new_table['columns']}"))
+        changed_cells = sum(
+            1 for old_cell, new_cell in zip(old_table["cells"], new_table["cells"])
+            if old_cell["text"] != new_cell["text"]
+        )
+        if changed_cells:
+            changes.append(("cell text", f"{changed_cells} cells changed"))
+        return changes
+
+    old_para, new_para = old["paragraph"], new["paragraph"]
+    if old_para["text"] != new_para["text"]:
+        changes.append(("text", f"{short(old_para['text'])} -> {short(new_para['text'])}"))
+    if old_para["style"] != new_para["style"]:
+        changes.append(("style", f"{old_para['style']} -> {new_para['style']}"))
+    if old_para["numbering"] != new_para["numbering"]:
+        changes.append(("numbering", f"{old_para['numbering']} -> {new_para['numbering']}"))
+    old_formats, new_formats = run_formats(old_para), run_formats(new_para)
+    if old_formats != new_formats:
+        if len(old_formats) != len(new_formats):
+            changes.append(("runs", f"{len(old_formats)} runs -> {len(new_formats)} runs"))
+        else:
+            changed = [k + 1 for k, (a, b) in enumerate(zip(old_formats, new_formats)) if a != b]
+            changes.append(("run format", f"runs {', '.join(map(str, changed))} formatted differently"))
+    if len(old_para["drawings"]) != len(new_para["drawings"]):
+        changes.append(("drawings", f"{len(old_para['drawings'])} -> {len(new_para['drawings'])}"))
+    return changes
+
+def diff_indexes(old_index, new_index):
+    """Differences between two document indexes, as dicts with kind, template and letter position and detail.
+
+    Consecutive added or removed blocks are reported as one difference.
+    """
+    old_blocks, new_blocks = body_blocks(old_index), body_blocks(new_index)
+    levels = range(len(old_blocks[0]["keys"]) if old_blocks else 1)
+    pairs = align(
+        [[block["keys"][level] for block in old_blocks] for level in levels],
+        [[block["keys"][level] for block in new_blocks] for level in levels],
+    )
+
+    differences = []
+    last_old = None
+    # added or removed difference that the next blocks of the same kind are joined to
+    current = None
+    for i, j in pairs:
+        if i is not None and j is not None:
+            current = None
+            last_old = old_blocks[i]["label"]
+            for kind, detail in compare_blocks(old_blocks[i], new_blocks[j]):
+                differences.append({"kind": kind, "template": old_blocks[i]["label"],
+                                    "letter": new_blocks[j]["label"], "detail": detail})
+            continue
+
+        kind = "added" if i is None else "removed"
+        block = new_blocks[j] if i is None else old_blocks[i]
+        if current is None or current["kind"] != kind:
+            where = f"after {last_old}" if last_old else "at start"
+            current = {"kind": kind, "template": where, "letter": None, "blocks": []}
+            differences.append(current)
+        current["blocks"].append(block)
+        if i is not None:
+            last_old = block["label"]
+
+    # close added/removed runs: count their blocks and show the first one
+    for difference in differences:
+        blocks = difference.pop("blocks", None)
+        if blocks is None:
+            continue
+        first = blocks[0]
+        text = first["paragraph"]["text"] if "paragraph" in first else first["label"]
+        span = first["label"] if len(blocks) == 1 else f"{first['label']}..{blocks[-1]['label']}"
+        difference["detail"] = f"{len(blocks)} blocks, first {short(text)}"
+        if difference["kind"] == "added":
+            difference["letter"] = span
+        else:
+            difference["template"] = span
+    return differences
+
+def load_index(doc_path):
+    return index_document(Document(doc_path))
+
+def print_differences(differences):
+    if not differences:
+        print("No differences")
+    for difference in differences:
+        letter = f" -> {difference['letter']}" if difference.get("letter") else ""
+        print(f"{difference['template']}{letter}: {difference['kind']}: {difference['detail']}")
+
+def diff_documents(template_path, letter_path, as_json=False):
+    """Print the structural differences between a template and one letter."""
+    differences = diff_indexes(load_index(template_path), load_index(letter_path))
+    if as_json:
+        print(json.dumps({"template": str(template_path), "letter": str(letter_path),
+                          "differences": differences}, ensure_ascii=False, indent=2))
+        return
+    print(f"{'='*50}")
+    print(f"DIFF: {template_path} -> {letter_path}")
+    print(f"{'='*50}")
+    print_differences(differences)
+
+# The template index, built once per process for batch diffs
+_template_index = None
+
+def init_diff_worker(template_path):
+    global _template_index
+    _template_index = load_index(template_path)
+
+def diff_letter(letter_path):
+    """Batch task: (letter name, differences or None, error) for one letter against the worker's template."""
     try:
-        # Access the document part to find drawings
-        main_document_part = doc._part
-        if hasattr(main_document_part, '_element'):
-            # Find all drawing objects using XPath
-            drawings = main_document_part._element.xpath('.//w:drawing')
-            if drawings:
-                print(f"Found {len(drawings)} drawing objects in document")
-                for i, drawing in enumerate(drawings):
-                    # Try to identify which paragraph contains this drawing
-                    para_index = "Unknown"
-                    for j, para in enumerate(doc.paragraphs):
-                        if para._p.xpath('.//w:drawing'):
-                            for draw in para._p.xpath('.//w:drawing'):
-                                if draw == drawing:
-                                    para_index = j + 1
-                                    break
-                    
-                    print(f"Drawing {i+1}: Located in paragraph approximately #{para_index}")
-            else:
-                print("No drawing objects found")
+        return letter_path.name, diff_indexes(_template_index, load_index(letter_path)), None
     except Exception as e:
-        print(f"Error checking drawing objects: {e}")
+        return letter_path.name, None, f"{type(e).__name__}: {e}"
+
+def deviation_kind(differences):
+    """What a letter's differences look like, ignoring the text: their kinds and template positions."""
+    return tuple((difference["kind"], difference["template"]) for difference in differences)
+
+def diff_folder(template_path, folder, workers=1, as_json=False):
+    """Diff every letter in a folder against the template and group letters by their kind of deviation."""
+    letter_paths = sorted(
+        path for path in Path(folder).glob("*.docx")
+        if not path.name.startswith("~$") and path.resolve() != Path(template_path).resolve()
+    )
+    if workers > 1 and len(letter_paths) > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_diff_worker, initargs=(template_path,)) as executor:
+            results = list(executor.map(diff_letter, letter_paths, chunksize=max(1, len(letter_paths) // (workers * 8))))
+    else:
+        init_diff_worker(template_path)
+        results = [diff_letter(path) for path in letter_paths]
+
+    clusters = {}
+    errors = []
+    for name, differences, error in results:
+        if error:
+            errors.append((name, error))
+            continue
+        cluster = clusters.setdefault(deviation_kind(differences), {"letters": [], "differences": differences})
+        cluster["letters"].append(name)
+    ordered = sorted(clusters.values(), key=lambda cluster: -len(cluster["letters"]))
+
+    if as_json:
+        print(json.dumps({"template": str(template_path), "clusters": ordered,
+                          "errors": [{"letter": name, "error": error} for name, error in errors]},
+                         ensure_ascii=False, indent=2))
+        return
+
+    print(f"{'='*50}")
+    print(f"DIFF: {template_path} -> {len(letter_paths)} letters in {folder}")
+    print(f"{'='*50}")
+    for number, cluster in enumerate(ordered, start=1):
+        letters = cluster["letters"]
+        print(f"\nGroup {number}: {len(letters)} letters, e.g. {', '.join(letters[:3])}")
+        print_differences(cluster["differences"])
+    if errors:
+        print(f"\n{len(errors)} letters could not be read:")
+        for name, error in errors:
+            print(f"  {name}: {error}")
 
 def main():
+    parser = argparse.ArgumentParser(description="Print the structure of a .docx file.")
+    parser.add_argument("doc_path", nargs="?", help="document to dump (default: DEBUG_DOXC_PATH or the template from .env)")
+    parser.add_argument("--json", action="store_true", help="print the document index (or the diff) as JSON")
+    parser.add_argument("--diff", metavar="LETTER", help="compare the document with a letter, or with every letter in a folder")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes for a folder diff (0 = one per CPU)")
+    args = parser.parse_args()
+
+    # with --json only the JSON goes to stdout
+    log = sys.stderr if args.json else sys.stdout
+
     # Priority 1: Command line argument
-    if len(sys.argv) > 1:
-        doc_path = sys.argv[1]
-        print(f"Using document path from command line: {doc_path}")
-    
+    if args.doc_path:
+        doc_path = args.doc_path
+        print(f"Using document path from command line: {doc_path}", file=log)
+
     # Priority 2: DEBUG_DOXC_PATH from .env
     else:
         debug_path = os.environ.get("DEBUG_DOXC_PATH")
         if debug_path:
             doc_path = debug_path
-            print(f"Using document path from DEBUG_DOXC_PATH: {doc_path}")
-        
+            print(f"Using document path from DEBUG_DOXC_PATH: {doc_path}", file=log)
+
         # Priority 3: Template path from .env
         else:
             etapas_dir = os.environ.get("DIR_ETAPAS")
             template_filename = os.environ.get("TEMPLATE_FILE_NAME")
-            
+
             if not etapas_dir or not template_filename:
-                print("No document path provided. Please either:")
-                print("1. Provide a path as command line argument")
-                print("2. Set DEBUG_DOXC_PATH in .env")
-                print("3. Set DIR_ETAPAS and TEMPLATE_FILE_NAME in .env")
+                print("No document path provided. Please either:", file=log)
+                print("1. Provide a path as command line argument", file=log)
+                print("2. Set DEBUG_DOXC_PATH in .env", file=log)
+                print("3. Set DIR_ETAPAS and TEMPLATE_FILE_NAME in .env", file=log)
                 return
-                
+
             doc_path = Path(etapas_dir) / template_filename
-            print(f"Using template path: {doc_path}")
-    
-    print_doc_structure(doc_path)
+            print(f"Using template path: {doc_path}", file=log)
+
+    if args.diff and Path(args.diff).is_dir():
+        diff_folder(doc_path, args.diff, args.workers or os.cpu_count(), args.json)
+    elif args.diff:
+        diff_documents(doc_path, args.diff, args.json)
+    else:
+        print_doc_structure(doc_path, args.json)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,189 @@
+"""
+Zip-level DOCX Writer
+
+Writes documents generated from one template straight to the .docx zip. Every part
+that is still identical to the template (styles, numbering, images, fonts, headers, ...)
+is copied as the template's already-compressed bytes, only the parts that really changed
+(normally just word/document.xml) are serialized and compressed again.
+
+replace_members() does the same for fixing existing documents in place: only the
+replaced members are compressed, all others are copied verbatim.
+"""
+
+import io
+import os
+import struct
+import time
+import zipfile
+import zlib
+from pathlib import Path
+
+from docx import Document
+from docx.opc.pkgwriter import _ContentTypesItem
+
+LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+END_OF_CENTRAL_DIR = struct.Struct("<IHHHHIIH")
+
+# Bit 3: sizes stored in a data descriptor after the data. Entries are always written
+# with sizes in the local header, so the flag is dropped from copied entries.
+FLAG_DATA_DESCRIPTOR = 0x08
+FLAG_UTF8 = 0x800
+
+
+def read_entries(path):
+    """Return {member name: (ZipInfo, compressed bytes)} for every member of a zip file, in zip order."""
+    entries = {}
+    with open(path, "rb") as f, zipfile.ZipFile(f) as zf:
+        for info in zf.infolist():
+            f.seek(info.header_offset)
+            header = LOCAL_HEADER.unpack(f.read(LOCAL_HEADER.size))
+            f.seek(header[9] + header[10], io.SEEK_CUR)
+            entries[info.filename] = (info, f.read(info.compress_size))
+    return entries
+
+
+class RawZipWriter:
+    """Writes a zip member by member, either from already-compressed bytes or from new content"""
+
+    def __init__(self, f):
+        self.f = f
+        self.date_time = time.localtime()[:6]
+        self.central = []
+        self.offset = 0
+
+    def copy(self, name, info, data):
+        """Write a member from another zip as it is, without decompressing it."""
+        self._write(name, info.compress_type, info.flag_bits, info.date_time, info.CRC, info.file_size, data)
+
+    def add(self, name, blob):
+        """Deflate and write new content."""
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        data = compressor.compress(blob) + compressor.flush()
+        self._write(name, zipfile.ZIP_DEFLATED, 0, self.date_time, zlib.crc32(blob), len(blob), data)
+
+    def close(self):
+        """Write the central directory. Returns the number of bytes written in total."""
+        directory = b"".join(self.central)
+        self.f.write(directory)
+        self.f.write(END_OF_CENTRAL_DIR.pack(
+            0x06054b50, 0, 0, len(self.central), len(self.central), len(directory), self.offset, 0
+        ))
+        return self.offset + len(directory) + END_OF_CENTRAL_DIR.size
+
+    def _write(self, name, method, flags, date_time, crc, size, data):
+        encoded_name = name.encode("utf-8")
+        flags &= ~FLAG_DATA_DESCRIPTOR
+        if not encoded_name.isascii():
+            flags |= FLAG_UTF8
+        dos_time, dos_date = self._dos_date_time(date_time)
+
+        header = LOCAL_HEADER.pack(
+            0x04034b50, 20, flags, method, dos_time, dos_date,
+            crc, len(data), size, len(encoded_name), 0
+        )
+        self.f.write(header)
+        self.f.write(encoded_name)
+        self.f.write(data)
+        self.central.append(CENTRAL_HEADER.pack(
+            0x02014b50, 20, 20, flags, method, dos_time, dos_date,
+            crc, len(data), size, len(encoded_name), 0, 0, 0, 0, 0, self.offset
+        ) + encoded_name)
+        self.offset += len(header) + len(encoded_name) + len(data)
+
+    @staticmethod
+    def _dos_date_time(date_time):
+        year, month, day, hour, minute, second = date_time
+        return (hour << 11) | (minute << 5) | (second // 2), ((year - 1980) << 9) | (month << 5) | day
+
+
+def replace_members(path, replacements):
+    """Rewrite the zip at path with some members replaced ({name: bytes}), copying all others verbatim.
+    
+    The new file is written next to the old one and then moved over it.
+    """
+    entries = read_entries(path)
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        writer = RawZipWriter(f)
+        for name, (info, data) in entries.items():
+            if name in replacements:
+                writer.add(name, replacements[name])
+            else:
+                writer.copy(name, info, data)
+        writer.close()
+    os.replace(tmp_path, path)
+
+
+def package_items(package, shared_parts=()):
+    """Yield (zip member name, bytes) for everything python-docx would save for `package`.
+    
+    Parts in `shared_parts` (and their rels) are yielded with None instead of being serialized.
+    """
+    parts = list(package.iter_parts())
+    yield "[Content_Types].xml", _ContentTypesItem.from_parts(parts).blob
+    yield "_rels/.rels", package.rels.xml
+    for part in parts:
+        shared = part in shared_parts
+        if not shared:
+            part.before_marshal()
+        yield part.partname.membername, None if shared else part.blob
+        if len(part.rels):
+            yield part.partname.rels_uri.membername, None if shared else part.rels.xml
+
+
+class DocxZipWriter:
+    """Saves packages built from one template, reusing the template's compressed parts"""
+
+    def __init__(self, template_path, shared_package=None, changing_parts=()):
+        """Read the template zip and what python-docx serializes for each of its parts.
+        
+        `shared_package` is an already loaded copy of the template whose parts callers reuse
+        but never modify, except for `changing_parts`. The other parts are copied without
+        serializing and comparing them.
+        """
+        self.template_path = template_path
+        self.entries = read_entries(template_path)
+
+        # Compare against python-docx's own serialization of the template, so an unchanged
+        # part matches even if Word wrote it with different quoting or line endings
+        package = shared_package or Document(template_path).part.package
+        # A part python-docx created after loading (e.g. a default styles part) has no template
+        # bytes to copy, so it is serialized like a changing part
+        self.shared_parts = {
+            part for part in package.iter_parts()
+            if part.partname.membername in self.entries
+            and (not len(part.rels) or part.partname.rels_uri.membername in self.entries)
+        } - set(changing_parts) if shared_package else set()
+        self.baseline = {}
+        for name, blob in package_items(package):
+            self.baseline[name] = self._as_bytes(blob)
+
+    @staticmethod
+    def _as_bytes(blob):
+        return blob.encode("utf-8") if isinstance(blob, str) else blob
+
+    def write(self, output, package):
+        """Save `package` to `output` (a path or a binary file). Returns the number of bytes written."""
+        if hasattr(output, "write"):
+            return self._write_zip(output, package)
+        with open(output, "wb") as f:
+            return self._write_zip(f, package)
+
+    def to_bytes(self, package):
+        """Return `package` as .docx bytes."""
+        buffer = io.BytesIO()
+        self._write_zip(buffer, package)
+        return buffer.getvalue()
+
+    def _write_zip(self, f, package):
+        """Write every member of package. Returns the number of bytes written."""
+        writer = RawZipWriter(f)
+        for name, blob in package_items(package, self.shared_parts):
+            blob = self._as_bytes(blob)
+            if name in self.entries and (blob is None or self.baseline.get(name) == blob):
+                writer.copy(name, *self.entries[name])
+            else:
+                writer.add(name, blob)
+        return writer.close()
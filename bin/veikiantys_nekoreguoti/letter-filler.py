@@ -8,109 +8,355 @@ It handles proper formatting, signatures, and project-specific content.
 from pathlib import Path
 import csv
 import os
+import codecs
 import copy
+import hashlib
+import io
+import json
+import sys
+import time
+import traceback
 from datetime import date
-from collections import defaultdict
+from collections import defaultdict, Counter
+from collections.abc import Mapping
+from contextlib import ExitStack
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
 import re
+import zipfile
 
 from dotenv import load_dotenv
 from docx import Document
+from docx.package import Package
+from docx.parts.document import DocumentPart
+from docx.enum.style import WD_STYLE_TYPE
 from docx.shared import Pt
+from docx.text.paragraph import Paragraph
+from docx.text.run import Run
 from docx.oxml.ns import qn
 from docx.oxml import OxmlElement
 
+from docx_zip import DocxZipWriter
+
 load_dotenv()
 
-class FormatHelper:
-    """Helper class for document text and formatting operations"""
+# Write all letters of a run into this one zip archive in the letters folder instead of separate files
+LETTERS_ZIP = os.environ.get("LETTERS_ZIP")
+
+# CSV delimiter of the input file; sniffed from the file when not set
+CSV_DELIMITER = os.environ.get("CSV_DELIMITER", "").replace("\\t", "\t")
+
+# Bump whenever a code change alters the letters, so the next run regenerates all of them
+GENERATOR_VERSION = 3
+
+# Ignore the manifest and regenerate every letter
+FULL_RUN = "--full" in sys.argv
+
+# Check the 'Pridedama:' / attestation bullet order of every letter before it is saved
+VALIDATE_LETTERS = os.environ.get("VALIDATE_LETTERS", "").lower() in ("1", "true", "yes")
+
+
+def ve_sort_key(key):
+    """Sort key of a VE id: the number after "VE", ids without one last."""
+    m = re.search(r"VE(\d+)", key, re.IGNORECASE)
+    return int(m.group(1)) if m else float("inf")
+
+
+def is_attestation_text(text):
+    """Whether a paragraph text is an attestation bullet."""
+    return "Skelbimas apie" in text or "projektinių pasiūlymų viešinimą" in text
+
+
+def mentions_ve(text, ve):
+    """Whether `text` names the VE id `ve` (VE1 does not match VE12, ids may end in any character)."""
+    return re.search(rf"{re.escape(ve)}(?!\w)", text) is not None
+
+
+class DocumentHelper:
+    """Helper class for document manipulation operations"""
     
     @staticmethod
-    def replace_text_in_paragraph(paragraph, replacements):
-        """Replace placeholders in a paragraph while preserving formatting."""
-        for key, value in replacements.items():
-            for run in paragraph.runs:
-                if key in run.text:
-                    run.text = run.text.replace(key, value)
+    def new_paragraph(doc, text=""):
+        """Create a paragraph that is not in the document body yet (insert it with insert_after)."""
+        para = Paragraph(OxmlElement('w:p'), doc._body)
+        if text:
+            para.add_run(text)
+        return para
     
     @staticmethod
-    def replace_text_in_cell(cell, replacements):
-        """Replace placeholders in a table cell while preserving formatting."""
-        for paragraph in cell.paragraphs:
-            FormatHelper.replace_text_in_paragraph(paragraph, replacements)
+    def insert_after(cursor, para):
+        """Insert a paragraph right after the cursor element and return it as the new cursor."""
+        cursor.addnext(para._p)
+        return para._p
+
+
+class TemplateCache:
+    """Keeps the parsed template package in memory and hands out cheap per-letter clones"""
     
-    @staticmethod
-    def copy_run_format(source_run, target_run):
-        """Copy formatting from one run to another."""
-        target_run.bold = source_run.bold
-        target_run.italic = source_run.italic
-        target_run.underline = source_run.underline
-        if source_run.font.size:
-            target_run.font.size = source_run.font.size
-        if source_run.font.name:
-            target_run.font.name = source_run.font.name
-        if hasattr(source_run.font, 'color') and source_run.font.color:
-            target_run.font.color.rgb = source_run.font.color.rgb
+    def __init__(self, template_path):
+        """Parse the template once."""
+        self.template_doc = Document(template_path)
+        self._document_part = self.template_doc.part
+        self._package = self._document_part.package
     
-    @staticmethod
-    def copy_para_format(source_para, target_para):
-        """Copy paragraph formatting attributes from one paragraph to another."""
-        for attr in ['alignment', 'left_indent', 'right_indent', 'first_line_indent', 
-                    'line_spacing', 'space_before', 'space_after', 'keep_together', 
-                    'keep_with_next', 'page_break_before', 'widow_control']:
-            if hasattr(source_para.paragraph_format, attr):
-                setattr(target_para.paragraph_format, attr, getattr(source_para.paragraph_format, attr))
+    def clone(self):
+        """Return a new document for one letter.
+        
+        Only the main document part (word/document.xml) is deep-copied, every other part
+        (styles, numbering, images, headers, ...) is shared with the cached template, so
+        letters must only change the document body.
+        """
+        package = Package()
+        template_part = self._document_part
+        document_part = DocumentPart(
+            template_part.partname,
+            template_part.content_type,
+            copy.deepcopy(template_part.element),
+            package
+        )
         
-        # Copy style if available
-        if source_para.style:
-            target_para.style = source_para.style
+        for rId, rel in template_part.rels.items():
+            target = rel.target_ref if rel.is_external else rel.target_part
+            document_part.rels.add_relationship(rel.reltype, target, rId, rel.is_external)
+        
+        for rId, rel in self._package.rels.items():
+            if rel.is_external:
+                target = rel.target_ref
+            elif rel.target_part is template_part:
+                target = document_part
+            else:
+                target = rel.target_part
+            package.rels.add_relationship(rel.reltype, target, rId, rel.is_external)
+        
+        return document_part.document
 
 
-class DocumentHelper:
-    """Helper class for document manipulation operations"""
+class TemplateIndex:
+    """Positions of placeholders and anchor paragraphs in the template, found once per template"""
     
-    @staticmethod
-    def find_paragraph_with_text(doc, text_to_find):
-        """Find a paragraph containing specific text."""
-        for i, para in enumerate(doc.paragraphs):
-            if text_to_find in para.text:
-                return i
-        return -1
+    PLACEHOLDERS = ("gavejas_1", "adresas_2", "pasto_kodas_3", "proj_data")
+    ANCHORS = (
+        "proj_pav_5",
+        "elektrines_numeris_11",
+        "Informacija apie",
+        "Šis pranešimas yra informacinio pobūdžio",
+        "Pridedama:",
+        "Skelbimas apie",
+        "Pagarbiai",
+        "El. p.:"
+    )
     
-    @staticmethod
-    def set_bullet_numbering(para_with_numbering, target_para):
-        """Copy bullet points/numbering from one paragraph to another."""
-        if not hasattr(para_with_numbering, '_p') or para_with_numbering._p.pPr is None:
-            return False
+    def __init__(self, template_doc):
+        """Scan the template paragraphs and tables once."""
+        root = template_doc.element
+        self.template_paragraphs = template_doc.paragraphs
         
-        p_pr = para_with_numbering._p.pPr
-        if p_pr.numPr is None:
-            return False
+        # placeholder -> paths of the runs containing it
+        self.placeholder_runs = {key: [] for key in self.PLACEHOLDERS}
+        paragraphs = list(self.template_paragraphs)
+        for table in template_doc.tables:
+            for row in table.rows:
+                for cell in row.cells:
+                    paragraphs.extend(cell.paragraphs)
+        for para in paragraphs:
+            for run in para.runs:
+                for key in self.PLACEHOLDERS:
+                    if key in run.text:
+                        path = self._path(root, run._r)
+                        if path not in self.placeholder_runs[key]:
+                            self.placeholder_runs[key].append(path)
         
-        # Get the numId and ilvl from source paragraph
-        if p_pr.numPr.numId is None or p_pr.numPr.ilvl is None:
-            return False
-            
-        num_id = p_pr.numPr.numId.val
-        ilvl = p_pr.numPr.ilvl.val
+        # anchor -> index in template paragraphs and path of that paragraph (first match)
+        self.anchor_indices = {}
+        self.anchor_paths = {}
+        for i, para in enumerate(self.template_paragraphs):
+            text = para.text
+            for anchor in self.ANCHORS:
+                if anchor not in self.anchor_indices and anchor in text:
+                    self.anchor_indices[anchor] = i
+                    self.anchor_paths[anchor] = self._path(root, para._p)
         
-        # Make sure target paragraph has a paragraph properties element
-        if target_para._p.pPr is None:
-            target_para._p.get_or_add_pPr()
+        # Plot table: second row of the first table is the row template
+        self.plot_row = None
+        self.plot_row_path = None
+        tables = template_doc.tables
+        if tables and len(tables[0].rows) >= 2:
+            self.plot_row = tables[0].rows[1]._tr
+            self.plot_row_path = self._path(root, self.plot_row)
         
-        # Add numPr element if it doesn't exist
-        num_pr = target_para._p.pPr.get_or_add_numPr()
+        # Paragraph styles named like bullet/list styles, and the default style unstyled paragraphs use
+        self.paragraph_styles = set()
+        self.bullet_styles = set()
+        self.default_style = None
+        for style in template_doc.styles:
+            if style.type != WD_STYLE_TYPE.PARAGRAPH:
+                continue
+            self.paragraph_styles.add(style.style_id)
+            if style.element.default:
+                self.default_style = style.style_id
+            name = (style.name or "").lower()
+            if "bullet" in name or "list" in name:
+                self.bullet_styles.add(style.style_id)
+    
+    @staticmethod
+    def _path(root, element):
+        """Child-index path from the document root to an element."""
+        path = []
+        while element is not root:
+            parent = element.getparent()
+            path.append(parent.index(element))
+            element = parent
+        return tuple(reversed(path))
+    
+    @staticmethod
+    def _follow(root, path):
+        """Element at a child-index path; valid in any untouched clone of the template."""
+        element = root
+        for i in path:
+            element = element[i]
+        return element
+    
+    def is_bullet_style(self, p):
+        """Whether a paragraph element has (or falls back to) a bullet/list style."""
+        style_id = p.style
+        if style_id not in self.paragraph_styles:
+            style_id = self.default_style
+        return style_id in self.bullet_styles
+    
+    def template_paragraph(self, anchor):
+        """First template paragraph containing an anchor, or None."""
+        i = self.anchor_indices.get(anchor)
+        return self.template_paragraphs[i] if i is not None else None
+    
+    def resolve_anchors(self, doc):
+        """Map each anchor to its paragraph in a fresh clone of the template."""
+        root = doc.element
+        return {
+            anchor: Paragraph(self._follow(root, path), doc._body)
+            for anchor, path in self.anchor_paths.items()
+        }
+    
+    def resolve_plot_row(self, doc):
+        """The plot table's template row in a fresh clone, or None."""
+        if self.plot_row_path is None:
+            return None
+        return self._follow(doc.element, self.plot_row_path)
+    
+    def apply_replacements(self, doc, replacements):
+        """Replace placeholders in a fresh clone, touching only the indexed runs."""
+        root = doc.element
+        for key, value in replacements.items():
+            for path in self.placeholder_runs.get(key, ()):
+                run = Run(self._follow(root, path), doc._body)
+                run.text = run.text.replace(key, value)
+
+
+class TemplateFragments:
+    """Signature, attestation and project blocks compiled once per template into ready XML fragments"""
+    
+    ATTESTATION_TEXT = "Skelbimas apie energijos iš atsinaujinančių išteklių gamybos paskirties inžinerinio statinio, vėjo elektrinės {elektrine_nr}, projektinių pasiūlymų viešinimą (2 lapai);"
+    
+    def __init__(self, template_index):
+        """Build the fragments from the template paragraphs found by the index."""
+        # Signature: exact copies of the template paragraphs from "Pagarbiai," to the end,
+        # including their runs, drawings and paragraph properties
+        self.signature = None
+        pagarbiai_idx = template_index.anchor_indices.get("Pagarbiai")
+        if pagarbiai_idx is not None:
+            self.signature = [
+                copy.deepcopy(para._p)
+                for para in template_index.template_paragraphs[pagarbiai_idx:]
+            ]
         
-        # Set the numId - identifies the numbering definition
-        num_id_element = OxmlElement('w:numId')
-        num_id_element.set(qn('w:val'), str(num_id))
-        num_pr.append(num_id_element)
+        # Attestation bullet: the template bullet's paragraph properties (style and numbering
+        # included) with a single Arial 11pt run, falling back to the 'Pridedama:' formatting
+        source_para = (template_index.template_paragraph("Skelbimas apie")
+                       or template_index.template_paragraph("Pridedama:"))
+        self.attestation = OxmlElement('w:p')
+        if source_para is not None and source_para._p.pPr is not None:
+            self.attestation.append(copy.deepcopy(source_para._p.pPr))
+        self.attestation.append(self._arial_run(""))
         
-        # Set the ilvl - identifies the numbering level
-        ilvl_element = OxmlElement('w:ilvl')
-        ilvl_element.set(qn('w:val'), str(ilvl))
-        num_pr.append(ilvl_element)
+        # Extra project paragraph: the proj_pav_5 paragraph properties with Arial 11pt runs for
+        # the opening quote, the project text and the closing quote
+        proj_pav_para = template_index.template_paragraph("proj_pav_5")
+        self.project = OxmlElement('w:p')
+        if proj_pav_para is not None and proj_pav_para._p.pPr is not None:
+            self.project.append(copy.deepcopy(proj_pav_para._p.pPr))
+        for text in ("„", "", "\";"):
+            self.project.append(self._arial_run(text))
         
-        return True
+        # Plot table row: the template row with one empty run per cell, keeping the cell,
+        # paragraph and first run properties
+        self.plot_row = None
+        if template_index.plot_row is not None:
+            self.plot_row = self._empty_row(template_index.plot_row)
+    
+    @staticmethod
+    def _arial_run(text):
+        """A w:r with Arial 11pt run properties and one w:t holding text."""
+        run = Paragraph(OxmlElement('w:p'), None).add_run("")
+        run.font.name = "Arial"
+        run.font.size = Pt(11)
+        t = OxmlElement('w:t')
+        t.set(qn('xml:space'), 'preserve')
+        t.text = text
+        run._r.append(t)
+        return run._r
+    
+    @staticmethod
+    def _empty_row(template_tr):
+        """Copy of a table row whose cells each hold one formatted, empty run."""
+        row = copy.deepcopy(template_tr)
+        for tc in row.iterchildren(qn('w:tc')):
+            first_p = tc.find(qn('w:p'))
+            first_r = first_p.find('.//' + qn('w:r')) if first_p is not None else None
+            for child in list(tc):
+                if child.tag != qn('w:tcPr'):
+                    tc.remove(child)
+            
+            p = OxmlElement('w:p')
+            if first_p is not None and first_p.pPr is not None:
+                p.append(copy.deepcopy(first_p.pPr))
+            r = OxmlElement('w:r')
+            if first_r is not None and first_r.rPr is not None:
+                r.append(copy.deepcopy(first_r.rPr))
+            t = OxmlElement('w:t')
+            t.set(qn('xml:space'), 'preserve')
+            r.append(t)
+            p.append(r)
+            tc.append(p)
+        return row
+    
+    def plot_rows(self, plots_data):
+        """Build all plot table rows in one pass from the prepared row."""
+        rows = []
+        for plot in plots_data:
+            row = copy.deepcopy(self.plot_row)
+            # Registro Nr, Unikalus Nr, Kadastro Nr, Sklypo adresas
+            values = (plot[0], plot[2], plot[3], plot[1])
+            for t, value in zip(row.iter(qn('w:t')), values):
+                t.text = value
+            rows.append(row)
+        return rows
+    
+    def signature_block(self):
+        """Fresh copy of the signature paragraphs for one letter (None if the template has none)."""
+        if self.signature is None:
+            return None
+        return [copy.deepcopy(element) for element in self.signature]
+    
+    def attestation_paragraph(self, doc, elektrine_nr):
+        """Fresh attestation bullet for one VE, not yet inserted into the body."""
+        element = copy.deepcopy(self.attestation)
+        element.find('.//' + qn('w:t')).text = self.ATTESTATION_TEXT.format(elektrine_nr=elektrine_nr)
+        return Paragraph(element, doc._body)
+    
+    def project_paragraph(self, doc, content):
+        """Fresh project paragraph quoting content, not yet inserted into the body."""
+        element = copy.deepcopy(self.project)
+        element.findall('.//' + qn('w:t'))[1].text = content
+        return Paragraph(element, doc._body)
 
 
 class LetterGenerator:
@@ -119,12 +365,18 @@ class LetterGenerator:
     def __init__(self, template_path):
         """Initialize with template document."""
         self.template_path = template_path
-        self.template_doc = Document(template_path)
+        self.template_cache = TemplateCache(template_path)
+        self.template_doc = self.template_cache.template_doc
+        self.template_index = TemplateIndex(self.template_doc)
+        self.template_fragments = TemplateFragments(self.template_index)
+        # Letters share every part except word/document.xml with the cached template
+        self.zip_writer = DocxZipWriter(template_path, self.template_doc.part.package)
     
     def create_letter(self, recipient_data, plot_data, project_data, today_date):
         """Create a customized letter based on provided data."""
-        # Create a new document from the template
-        doc = Document(self.template_path)
+        # Create a new document from the cached template
+        doc = self.template_cache.clone()
+        anchors = self.template_index.resolve_anchors(doc)
         
         # Set up replacements dictionary
         replacements = {
@@ -141,75 +393,50 @@ class LetterGenerator:
         self._fill_table_with_plots(doc, plot_data)
         
         # Add project descriptions
-        self._add_project_descriptions(doc, project_data)
+        self._add_project_descriptions(doc, project_data, anchors)
         
         # Add attestation paragraphs
-        self._add_attestation_paragraphs(doc, project_data)
+        attestation_count = self._add_attestation_paragraphs(doc, project_data, anchors)
         
         # Copy signature and add email
-        self._add_signature_content(doc)
-        self._ensure_email_in_document(doc, "domantas.aleknavicius@etprojektai.eu")
+        self._add_signature_content(doc, attestation_count > 0)
+        self._ensure_email_in_document(doc, anchors, "domantas.aleknavicius@etprojektai.eu")
         
         return doc
         
     def _apply_replacements(self, doc, replacements):
         """Apply text replacements throughout the document."""
-        # Replace in paragraphs
-        for para in doc.paragraphs:
-            FormatHelper.replace_text_in_paragraph(para, replacements)
-        
-        # Replace in tables
-        for table in doc.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    FormatHelper.replace_text_in_cell(cell, replacements)
+        # Only the runs the template index found placeholders in are touched
+        self.template_index.apply_replacements(doc, replacements)
     
     def _fill_table_with_plots(self, doc, plots_data):
         """Fill the table with plot data, adding rows as needed."""
-        if not doc.tables or not plots_data:
+        if not plots_data:
             return
         
-        table = doc.tables[0]
-        if len(table.rows) < 2:
+        # Get the template row (second row of the first table)
+        template_row = self.template_index.resolve_plot_row(doc)
+        if template_row is None:
             return
         
-        # Get the template row (second row)
-        template_row = table.rows[1]
-        
-        # Clear template row
-        for cell in template_row.cells:
-            cell.text = ""
-        
-        # Fill in first plot data
-        if plots_data:
-            first_plot = plots_data[0]
-            template_row.cells[0].text = first_plot[0]  # Registro Nr
-            template_row.cells[1].text = first_plot[2]  # Unikalus Nr
-            template_row.cells[2].text = first_plot[3]  # Kadastro Nr
-            template_row.cells[3].text = first_plot[1]  # Sklypo adresas
-        
-        # Add additional rows for the rest of the plots
-        for plot in plots_data[1:]:
-            new_row = table.add_row()
-            new_row.cells[0].text = plot[0]  # Registro Nr
-            new_row.cells[1].text = plot[2]  # Unikalus Nr
-            new_row.cells[2].text = plot[3]  # Kadastro Nr
-            new_row.cells[3].text = plot[1]  # Sklypo adresas
-    
-    def _add_project_descriptions(self, doc, project_data):
+        # Build every row from the prepared row template, then put them in the table in one go:
+        # the first plot replaces the template row, the rest go to the end of the table
+        rows = self.template_fragments.plot_rows(plots_data)
+        table = template_row.getparent()
+        table.replace(template_row, rows[0])
+        table.extend(rows[1:])
+    
+    def _add_project_descriptions(self, doc, project_data, anchors):
         """Add project descriptions to the document."""
         if not project_data:
             return
             
-        # Find paragraphs containing key placeholders
-        proj_pav_para_index = DocumentHelper.find_paragraph_with_text(doc, "proj_pav_5")
-        elektrine_para_index = DocumentHelper.find_paragraph_with_text(doc, "elektrines_numeris_11")
+        # Paragraphs containing key placeholders, located by the template index
+        proj_pav_para = anchors.get("proj_pav_5")
+        elektrine_para = anchors.get("elektrines_numeris_11")
         
-        if proj_pav_para_index < 0 or elektrine_para_index < 0:
+        if proj_pav_para is None or elektrine_para is None:
             return
-            
-        proj_pav_para = doc.paragraphs[proj_pav_para_index]
-        elektrine_para = doc.paragraphs[elektrine_para_index]
         
         # Keep original project order for proj_pav_5 behavior
         project_items = list(project_data.items())
@@ -221,11 +448,7 @@ class LetterGenerator:
                 run.text = run.text.replace("proj_pav_5", first_project_info.get("projekt_pav", ""))
         
         # Build sorted list of elektrine keys by numeric part after "VE"
-        def _ve_sort_key(key):
-            m = re.search(r"VE(\d+)", key, re.IGNORECASE)
-            return int(m.group(1)) if m else float("inf")
-        
-        sorted_keys = sorted(project_data.keys(), key=_ve_sort_key)
+        sorted_keys = sorted(project_data.keys(), key=ve_sort_key)
         
         # Replace elektrines_numeris_11 placeholder with ascending-ordered generator list (comma separated)
         formatted_list = ", ".join(sorted_keys)
@@ -238,29 +461,17 @@ class LetterGenerator:
             return
             
         # Process additional projects (append proj_pav paragraphs in original project_data order)
-        index_for_proj = proj_pav_para_index + 1
+        cursor = proj_pav_para._p
         
         for elektrine_nr, project_info in project_items[1:]:
             # Create a new project paragraph (pass project name to include address)
-            new_para = self._create_project_paragraph(doc, proj_pav_para, elektrine_nr, project_info.get("projekt_pav", ""))
+            new_para = self._create_project_paragraph(doc, elektrine_nr, project_info.get("projekt_pav", ""))
             
-            # Insert at the correct position and remove from end
-            doc._body._element.insert(index_for_proj, new_para._element)
-            doc._body._element.remove(doc.paragraphs[-1]._element)
-            
-            # Update index for next insertion
-            index_for_proj += 1
+            # Insert after the previous project paragraph and move the cursor onto it
+            cursor = DocumentHelper.insert_after(cursor, new_para)
     
-    def _create_project_paragraph(self, doc, template_para, elektrine_nr, project_pav=""):
+    def _create_project_paragraph(self, doc, elektrine_nr, project_pav=""):
         """Create a formatted project paragraph including project name/address."""
-        new_para = doc.add_paragraph()
-        FormatHelper.copy_para_format(template_para, new_para)
-        
-        # Add opening quote
-        quote_open = new_para.add_run("„")
-        quote_open.font.name = "Arial"
-        quote_open.font.size = Pt(11)
-        
         # Normalize and compose content without duplicating full phrase
         prefix = "Energijos iš atsinaujinančių išteklių gamybos paskirties inžinerinio statinio, vėjo elektrinės"
         proj = (project_pav or "").strip()
@@ -283,264 +494,381 @@ class LetterGenerator:
             # Fallback
             content = f"{prefix} {elektrine_nr}, statybos projektas"
         
-        content_run = new_para.add_run(content)
-        content_run.font.name = "Arial"
-        content_run.font.size = Pt(11)
+        # Prebuilt paragraph with the proj_pav_5 formatting and the quotes around the content
+        return self.template_fragments.project_paragraph(doc, content)
+    
+    def _add_attestation_paragraphs(self, doc, project_data, anchors):
+        """Insert attestation bullets after 'Pridedama:' — build VE list from project_data (ascending numeric).
         
-        # Add closing quote and semicolon/quote char matching template
-        quote_close = new_para.add_run("\";")
-        quote_close.font.name = "Arial"
-        quote_close.font.size = Pt(11)
+        Returns the number of attestation paragraphs inserted.
+        """
+        body = doc._body._element
         
-        return new_para
-    
-    def _add_attestation_paragraphs(self, doc, project_data):
-        """Insert attestation bullets after 'Pridedama:' — build VE list from project_data (ascending numeric)."""
         # find or insert 'Pridedama:' paragraph
-        pridedama_index = DocumentHelper.find_paragraph_with_text(doc, "Pridedama:")
-        if pridedama_index < 0:
+        pridedama = anchors.get("Pridedama:")
+        if pridedama is None:
             # try to place after the info paragraph or after regulation paragraph
-            info_idx = DocumentHelper.find_paragraph_with_text(doc, "Informacija apie")
-            reg_idx = DocumentHelper.find_paragraph_with_text(doc, "Šis pranešimas yra informacinio pobūdžio")
-            if info_idx >= 0:
-                insert_at = info_idx + 1
-            elif reg_idx >= 0:
-                insert_at = reg_idx + 1
+            after = anchors.get("Informacija apie") or anchors.get("Šis pranešimas yra informacinio pobūdžio")
+            if after is not None:
+                # insert a blank line and then Pridedama:
+                cursor = DocumentHelper.insert_after(after._p, DocumentHelper.new_paragraph(doc))
+                pridedama = DocumentHelper.new_paragraph(doc, "Pridedama:")
+                DocumentHelper.insert_after(cursor, pridedama)
             else:
-                insert_at = len(doc.paragraphs)
-            # insert a blank line and then Pridedama:
-            blank = doc.add_paragraph("")
-            doc._body._element.insert(insert_at, blank._p)
-            parent = blank._p.getparent()
-            if parent is not None:
-                parent.remove(blank._p)
-            pr_para = doc.add_paragraph("Pridedama:")
-            doc._body._element.insert(insert_at + 1, pr_para._p)
-            parent = pr_para._p.getparent()
-            if parent is not None:
-                parent.remove(pr_para._p)
-            pridedama_index = insert_at + 1
+                doc.add_paragraph("")
+                pridedama = doc.add_paragraph("Pridedama:")
 
         # Remove existing attestation bullets after Pridedama:
-        start = pridedama_index + 1
-        end = start
-        while end < len(doc.paragraphs) and ("Skelbimas apie" in (doc.paragraphs[end].text or "") or "projektinių pasiūlymų viešinimą" in (doc.paragraphs[end].text or "")):
-            end += 1
-        for idx in range(end - 1, start - 1, -1):
-            p = doc.paragraphs[idx]._p
-            parent = p.getparent()
-            if parent is not None:
-                parent.remove(p)
+        existing = []
+        for element in pridedama._p.itersiblings():
+            if element.tag != qn('w:p'):
+                if element.tag == qn('w:sectPr'):
+                    break
+                continue
+            if not is_attestation_text(Paragraph(element, doc._body).text or ""):
+                break
+            existing.append(element)
+
+        # Templates with the bullets above 'Pridedama:' lose those bullets too, and any other
+        # bullet block right before it ends up below it (what sutvarkytojas.py used to fix afterwards)
+        first_bullet = None
+        for element in pridedama._p.itersiblings(preceding=True):
+            if element.tag != qn('w:p'):
+                break
+            para = Paragraph(element, doc._body)
+            if is_attestation_text(para.text or ""):
+                existing.append(element)
+            elif self._is_bullet(para):
+                first_bullet = element
+            else:
+                break
+        for element in existing:
+            body.remove(element)
+        if first_bullet is not None:
+            first_bullet.addprevious(pridedama._p)
 
         # Build ordered VE list from project_data (sort by numeric part after "VE")
-        def _ve_sort_key(k):
-            m = re.search(r"VE(\d+)", k, re.IGNORECASE)
-            return int(m.group(1)) if m else float("inf")
-        ordered_ves = sorted(list(project_data.keys()), key=_ve_sort_key)
+        ordered_ves = sorted(list(project_data.keys()), key=ve_sort_key)
 
         # If no project_data available, try to derive from document content as fallback
         if not ordered_ves:
             proj_prefix = "Energijos iš atsinaujinančių išteklių gamybos paskirties inžinerinio statinio"
-            for i, para in enumerate(doc.paragraphs):
-                if i >= pridedama_index:
+            for element in body.iterchildren(qn('w:p')):
+                if element is pridedama._p:
                     break
-                text = para.text or ""
+                text = Paragraph(element, doc._body).text or ""
                 if proj_prefix in text:
                     m = re.findall(r"\bVE[0-9A-Za-z._-]*", text)
                     if m:
                         ordered_ves.append(m[0])
 
         if not ordered_ves:
-            return
+            return 0
 
-        # Find a template attestation paragraph for formatting (from template_doc first)
-        template_attestation_para = None
-        for para in self.template_doc.paragraphs:
-            if "Skelbimas apie" in para.text:
-                template_attestation_para = para
-                break
-        if template_attestation_para is None:
-            # fallback: try to find any bullet paragraph in current doc to copy numbering/format
-            for para in doc.paragraphs:
-                # heuristic: contains bullet words but not the full VE list
-                if "Skelbimas apie" in (para.text or ""):
-                    template_attestation_para = para
-                    break
-
-        # Insert one attestation paragraph per VE (preserve numbering/format when possible)
-        insert_pos = pridedama_index + 1
+        # Insert one prebuilt attestation paragraph per VE (template numbering/format)
+        cursor = pridedama._p
         for ve in ordered_ves:
-            source_para = template_attestation_para if template_attestation_para is not None else doc.paragraphs[pridedama_index]
-            new_att = self._create_attestation_paragraph(doc, source_para, ve)
-            # insert a deep copy of the newly created paragraph element at desired position
-            new_elem = new_att._p
-            new_copy = copy.deepcopy(new_elem)
-            doc._body._element.insert(insert_pos, new_copy)
-            # remove the appended original (created by _create_attestation_paragraph)
-            parent = new_elem.getparent()
-            if parent is not None:
-                parent.remove(new_elem)
-            insert_pos += 1
-    
-    def _create_attestation_paragraph(self, doc, template_para, elektrine_nr):
-        """Create a formatted attestation paragraph."""
-        new_para = doc.add_paragraph()
-        FormatHelper.copy_para_format(template_para, new_para)
-        
-        # Copy bullet points/numbering
-        DocumentHelper.set_bullet_numbering(template_para, new_para)
-        
-        # Add content with Arial 11pt
-        text = f"Skelbimas apie energijos iš atsinaujinančių išteklių gamybos paskirties inžinerinio statinio, vėjo elektrinės {elektrine_nr}, projektinių pasiūlymų viešinimą (2 lapai);"
-        run = new_para.add_run(text)
-        run.font.name = "Arial"
-        run.font.size = Pt(11)
+            new_att = self.template_fragments.attestation_paragraph(doc, ve)
+            cursor = DocumentHelper.insert_after(cursor, new_att)
+        return len(ordered_ves)
+    
+    def _is_bullet(self, para):
+        """Bullet/list paragraph: visible bullet char, list style or numbering (as in sutvarkytojas.py)."""
+        text = para.text.strip()
+        if not text:
+            return False
+        if text.startswith("•") or text.startswith("-"):
+            return True
+        if self.template_index.is_bullet_style(para._p):
+            return True
+        p_pr = para._p.pPr
+        return p_pr is not None and p_pr.numPr is not None
+    
+    def validate_letter(self, doc, project_data):
+        """Check the attestation block of a created letter in memory.
+        
+        'Pridedama:' must not follow a bullet, and must be followed by one attestation bullet
+        per VE in ascending order. Returns a list of problems, empty if the letter is fine.
+        """
+        body = doc._body._element
+        pridedama = None
+        for element in body.iterchildren(qn('w:p')):
+            if "pridedama:" in (Paragraph(element, doc._body).text or "").lower():
+                pridedama = element
+                break
+        if pridedama is None:
+            return ["'Pridedama:' paragraph missing"] if project_data else []
+        
+        problems = []
+        previous = pridedama.getprevious()
+        if previous is not None and previous.tag == qn('w:p') and self._is_bullet(Paragraph(previous, doc._body)):
+            problems.append("'Pridedama:' comes after a bullet")
+        
+        attestations = []
+        for element in pridedama.itersiblings(qn('w:p')):
+            text = Paragraph(element, doc._body).text or ""
+            if not is_attestation_text(text):
+                break
+            attestations.append(text)
         
-        return new_para
+        ordered_ves = sorted(project_data, key=ve_sort_key)
+        if ordered_ves and len(attestations) != len(ordered_ves):
+            problems.append(f"{len(attestations)} attestation bullets after 'Pridedama:', expected {len(ordered_ves)}")
+        for ve, text in zip(ordered_ves, attestations):
+            if not mentions_ve(text, ve):
+                problems.append(f"attestation bullet for {ve} missing or out of order")
+                break
+        return problems
     
-    def _add_signature_content(self, doc):
+    def _add_signature_content(self, doc, has_attestations):
         """Copy the signature content from template to the document."""
-        # Find the "Pagarbiai," paragraph in template
-        pagarbiai_idx_template = DocumentHelper.find_paragraph_with_text(self.template_doc, "Pagarbiai")
-        if pagarbiai_idx_template < 0:
+        # Prebuilt copy of the template paragraphs from "Pagarbiai," onwards
+        signature = self.template_fragments.signature_block()
+        if signature is None:
             return False
         
-        # Find the last attestation paragraph in target document
-        last_attestation_idx = -1
-        pridedama_idx = DocumentHelper.find_paragraph_with_text(doc, "Pridedama:")
+        # Add spacing after attestations
+        if has_attestations:
+            signature = [OxmlElement('w:p'), OxmlElement('w:p')] + signature
         
-        if pridedama_idx >= 0:
-            for i, para in enumerate(doc.paragraphs):
-                if "Skelbimas apie" in para.text and i > pridedama_idx:
-                    last_attestation_idx = i
+        # Append before the final section properties, like doc.add_paragraph does
+        body = doc._body._element
+        sect_pr = body.find(qn('w:sectPr'))
+        for element in signature:
+            if sect_pr is not None:
+                sect_pr.addprevious(element)
+            else:
+                body.append(element)
         
-        # Add spacing after attestations
-        if last_attestation_idx >= 0:
-            doc.add_paragraph()
-            doc.add_paragraph()
+        return True
+    
+    def _ensure_email_in_document(self, doc, anchors, email_address="domantas.aleknavicius@etprojektai.eu"):
+        """Ensure the email address is properly set in the document."""
+        para = anchors.get("El. p.:")
+        if para is None:
+            return False
         
-        # Get signature paragraphs from template
-        signature_paras = self.template_doc.paragraphs[pagarbiai_idx_template:]
+        # Clear and rebuild the paragraph
+        for run in list(para.runs):
+            run.clear()
         
-        # Add signature paragraphs with exact formatting
-        for para in signature_paras:
-            new_para = doc.add_paragraph()
-            FormatHelper.copy_para_format(para, new_para)
-            
-            for run in para.runs:
-                new_run = new_para.add_run(run.text)
-                FormatHelper.copy_run_format(run, new_run)
+        # Add label and email with Arial 11pt
+        label_run = para.add_run("El. p.:")
+        label_run.font.name = "Arial"
+        label_run.font.size = Pt(11)
         
-        # Copy drawings from template to target document
-        self._copy_drawing_objects(doc)
+        email_run = para.add_run(" " + email_address)
+        email_run.font.name = "Arial"
+        email_run.font.size = Pt(11)
         
         return True
+
+
+class CsvRowIndex(Mapping):
+    """Read-only {individual_key: rows} view of a CSV file that keeps only row offsets in memory
     
-    def _copy_drawing_objects(self, doc):
-        """Copy drawing objects from template to target document."""
-        try:
-            # Access template document part to find drawings
-            template_doc_part = self.template_doc._part
+    The file is indexed in one pass. Rows of one individual are read back from disk when that
+    individual is requested, so only one group of rows is held in memory at a time.
+    """
+    
+    def __init__(self, csv_path, delimiter):
+        """Index csv_path: byte spans of every row, grouped by individual key."""
+        self.csv_path = csv_path
+        self.delimiter = delimiter
+        self.spans = {}
+        self.first_rows = {}
+        
+        with open(csv_path, "rb") as f:
+            position = len(codecs.BOM_UTF8) if f.read(len(codecs.BOM_UTF8)) == codecs.BOM_UTF8 else 0
+            f.seek(position)
             
-            if not hasattr(template_doc_part, '_element'):
-                return
-                
-            # Find all drawing objects
-            drawings = template_doc_part._element.xpath('.//w:drawing')
-            if not drawings:
-                return
-                
-            # Find the "Pagarbiai," paragraph in target document
-            pagarbiai_idx_target = DocumentHelper.find_paragraph_with_text(doc, "Pagarbiai")
-            if pagarbiai_idx_target < 0:
-                return
-                
-            # Get the paragraph element
-            target_para = doc.paragraphs[pagarbiai_idx_target]._p
+            def lines():
+                nonlocal position
+                for line in f:
+                    position += len(line)
+                    yield line.decode("utf-8")
             
-            # Clone and insert each drawing
-            for drawing in drawings:
-                drawing_copy = copy.deepcopy(drawing)
-                target_para.append(drawing_copy)
-                
-        except Exception as e:
-            print(f"Error copying drawing objects: {e}")
-    
-    def _ensure_email_in_document(self, doc, email_address="domantas.aleknavicius@etprojektai.eu"):
-        """Ensure the email address is properly set in the document."""
-        for i, para in enumerate(doc.paragraphs):
-            if "El. p.:" in para.text:
-                # Clear and rebuild the paragraph
-                for run in list(para.runs):
-                    run.clear()
-                
-                # Add label and email with Arial 11pt
-                label_run = para.add_run("El. p.:")
-                label_run.font.name = "Arial"
-                label_run.font.size = Pt(11)
-                
-                email_run = para.add_run(" " + email_address)
-                email_run.font.name = "Arial"
-                email_run.font.size = Pt(11)
-                
-                return True
-        
-        return False
+            reader = csv.reader(lines(), delimiter=delimiter)
+            next(reader, None)  # Skip header row
+            row_start = position
+            for row in reader:
+                individual_key = CsvProcessor.individual_key(row)
+                if individual_key is not None:
+                    self.spans.setdefault(individual_key, []).append((row_start, position - row_start))
+                    self.first_rows.setdefault(individual_key, row)
+                row_start = position
+    
+    def __len__(self):
+        return len(self.spans)
+    
+    def __iter__(self):
+        return iter(self.spans)
+    
+    def __getitem__(self, individual_key):
+        with open(self.csv_path, "rb") as f:
+            return self._read_rows(f, self.spans[individual_key])
+    
+    def items(self):
+        """Yield (individual_key, rows) one individual at a time, reusing one file handle."""
+        with open(self.csv_path, "rb") as f:
+            for individual_key, spans in self.spans.items():
+                yield individual_key, self._read_rows(f, spans)
+    
+    def _read_rows(self, f, spans):
+        """Read and parse the rows at spans, reading adjacent rows in one go."""
+        rows = []
+        i = 0
+        while i < len(spans):
+            offset, length = spans[i]
+            i += 1
+            while i < len(spans) and spans[i][0] == offset + length:
+                length += spans[i][1]
+                i += 1
+            f.seek(offset)
+            text = f.read(length).decode("utf-8")
+            rows.extend(csv.reader(io.StringIO(text, newline=""), delimiter=self.delimiter))
+        return rows
+
+
+class MergedRowIndex(Mapping):
+    """Read-only {individual_key: rows} view over several CsvRowIndex files
+    
+    Only references to the indexes holding each individual's row offsets are kept; the rows
+    are read back from each file when that individual is requested.
+    """
+    
+    def __init__(self):
+        self.sources = {}
+    
+    def add(self, individual_key, row_index):
+        """Include the rows row_index has for individual_key."""
+        self.sources.setdefault(individual_key, []).append(row_index)
+    
+    def __len__(self):
+        return len(self.sources)
+    
+    def __iter__(self):
+        return iter(self.sources)
+    
+    def __getitem__(self, individual_key):
+        rows = []
+        for row_index in self.sources[individual_key]:
+            rows.extend(row_index[individual_key])
+        return rows
+    
+    def items(self):
+        """Yield (individual_key, rows) one individual at a time, with one open handle per file."""
+        with ExitStack() as stack:
+            handles = {}
+            for individual_key, row_indexes in self.sources.items():
+                rows = []
+                for row_index in row_indexes:
+                    if id(row_index) not in handles:
+                        handles[id(row_index)] = stack.enter_context(open(row_index.csv_path, "rb"))
+                    rows.extend(row_index._read_rows(handles[id(row_index)], row_index.spans[individual_key]))
+                yield individual_key, rows
 
 
 class CsvProcessor:
     """Class for processing CSV data into structured information for letters."""
     
-    def __init__(self, csv_path):
-        """Initialize with CSV file path."""
+    # Delimiters the sniffer may pick from when no delimiter is configured
+    SNIFF_DELIMITERS = ",;\t|"
+    
+    def __init__(self, csv_path, delimiter=None):
+        """Initialize with CSV file path and an optional delimiter (sniffed when not given)."""
         self.csv_path = csv_path
+        self.delimiter = delimiter
+    
+    def detect_delimiter(self):
+        """Return the configured delimiter, or sniff it from the start of the file."""
+        if self.delimiter:
+            return self.delimiter
+        with open(self.csv_path, "r", encoding="utf-8-sig", newline="") as f:
+            sample = f.read(4096)
+        try:
+            return csv.Sniffer().sniff(sample, delimiters=self.SNIFF_DELIMITERS).delimiter
+        except csv.Error:
+            return ","
         
     def read_data(self):
-        """Read and process CSV data into individuals with their plots and projects."""
-        # Detect delimiter
-        with open(self.csv_path, "r", encoding="utf-8-sig") as f:
-            sample = f.read(4096)
-            dialect = csv.Sniffer().sniff(sample)
-            delimiter = dialect.delimiter
-        
-        # Read CSV data
-        with open(self.csv_path, "r", encoding="utf-8-sig") as f:
-            reader = csv.reader(f, delimiter=delimiter)
-            header = next(reader)  # Skip header row
-            rows = list(reader)
+        """Index the CSV file by individual/company key. Rows are read lazily per individual."""
+        return CsvRowIndex(self.csv_path, self.detect_delimiter())
+    
+    @staticmethod
+    def individual_key(row):
+        """Key of the individual/company a data row belongs to, or None for rows to skip."""
+        if len(row) < 9:  # Need at least through the Tipas column
+            return None
             
-        # Group by individual
+        tipas = row[8].lower()
+        
+        if tipas == "fizinis":
+            # For individuals: combine first name and last name
+            vardas = row[5]
+            pavarde = row[6]
+            id_or_date = row[7]
+            return (vardas, pavarde, id_or_date)
+        elif tipas == "juridinis":
+            # For companies: use only the company name
+            vardas = row[5]
+            id_or_date = row[7]
+            return (vardas, "", id_or_date)
+        return None
+    
+    @staticmethod
+    def group_rows(rows):
+        """Group data rows (without header) by individual/company key."""
         individuals = defaultdict(list)
         
         for row in rows:
-            if len(row) < 9:  # Need at least through the Tipas column
-                continue
-                
-            tipas = row[8].lower()
-            
-            if tipas == "fizinis":
-                # For individuals: combine first name and last name
-                vardas = row[5]
-                pavarde = row[6]
-                id_or_date = row[7]
-                individual_key = (vardas, pavarde, id_or_date)
-            elif tipas == "juridinis":
-                # For companies: use only the company name
-                vardas = row[5]
-                pavarde = ""
-                id_or_date = row[7]
-                individual_key = (vardas, "", id_or_date)
-            else:
-                continue
-                
-            individuals[individual_key].append(row)
+            individual_key = CsvProcessor.individual_key(row)
+            if individual_key is not None:
+                individuals[individual_key].append(row)
             
         return individuals
         
+    @staticmethod
+    def recipient_name(individual_key, first_row):
+        """Name of the letter recipient: full name for individuals, company name for companies."""
+        vardas, pavarde, _ = individual_key
+        tipas = first_row[8].lower()
+        return f"{vardas} {pavarde}" if tipas == "fizinis" else vardas
+    
+    def output_names(self, individuals):
+        """Assign every individual a deterministic, collision-free output file name.
+        
+        Names depend only on the set of individuals, not on the order they are rendered in:
+        recipients sharing a name get their birth date / company code appended.
+        """
+        if isinstance(individuals, CsvRowIndex):
+            first_rows = individuals.first_rows
+        else:
+            first_rows = {key: rows[0] for key, rows in individuals.items()}
+        base_names = {
+            key: safe_filename(self.recipient_name(key, first_row))
+            for key, first_row in first_rows.items()
+        }
+        counts = Counter(base_names.values())
+        
+        names = {}
+        used = set()
+        for key in sorted(base_names):
+            name = base_names[key]
+            if counts[name] > 1:
+                name = f"{name}_{safe_filename(key[2])}"
+            candidate = name
+            suffix = 2
+            while candidate.lower() in used:
+                candidate = f"{name}_{suffix}"
+                suffix += 1
+            used.add(candidate.lower())
+            names[key] = f"{candidate}.docx"
+        return names
+        
     def process_individual(self, individual_key, individual_rows):
         """Process data for a single individual."""
         vardas, pavarde, id_or_date = individual_key
-        tipas = individual_rows[0][8].lower()
         
         # Skip if all entries have no address
         if all(len(row) <= 12 or not row[12] for row in individual_rows):
@@ -553,14 +881,14 @@ class CsvProcessor:
             
         # Create recipient data
         recipient_data = {
-            "name": f"{vardas} {pavarde}" if tipas == "fizinis" else vardas,
+            "name": self.recipient_name(individual_key, individual_rows[0]),
             "address": address_row[12],
             "postal_code": address_row[13] if len(address_row) > 13 and address_row[13] else ""
         }
         
-        # Collect unique projects and plot data
+        # Collect unique projects and plot data (plots keep their first-seen order)
         projects = {}
-        plots = set()
+        plots = {}
         
         for row in individual_rows:
             # Clean up the elektrine_nr 
@@ -575,7 +903,7 @@ class CsvProcessor:
             
             # Add unique plots
             plot_tuple = (row[0], row[1], row[2], row[3])
-            plots.add(plot_tuple)
+            plots[plot_tuple] = None
             
         return {
             "recipient": recipient_data,
@@ -584,77 +912,437 @@ class CsvProcessor:
         }
 
 
-def main():
-    # Load environment variables
-    etapas_dir = os.environ.get("DIR_ETAPAS")
-    template_filename = os.environ.get("TEMPLATE_FILE_NAME")
-    csv_filename = os.environ.get("ETAPAS_OUTPUT_FILE_NAME", "aggregated_output.csv")
+def file_hash(path):
+    """sha256 of a file's contents."""
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class LetterManifest:
+    """Remembers which inputs every letter in the output folder was rendered from"""
     
-    if not etapas_dir or not template_filename:
-        print("Please set DIR_ETAPAS and TEMPLATE_FILE_NAME in your .env file.")
-        exit(1)
+    FILENAME = "manifest.json"
+    
+    def __init__(self, output_folder, template_path):
+        """Load the manifest of output_folder (empty if there is none yet)."""
+        self.output_folder = Path(output_folder)
+        self.path = self.output_folder / self.FILENAME
+        self.template_hash = file_hash(template_path)
+        self.entries = {}
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+    
+    def entry(self, individual_rows):
+        """Manifest entry for a letter rendered from these CSV rows."""
+        rows_json = json.dumps(individual_rows, ensure_ascii=False)
+        return {
+            "inputs": hashlib.sha256(rows_json.encode("utf-8")).hexdigest(),
+            "template": self.template_hash,
+            "version": GENERATOR_VERSION
+        }
+    
+    def classify(self, filename, entry):
+        """'added', 'changed' or 'unchanged' for one wanted letter. A letter whose file is
+        missing counts as changed."""
+        if filename not in self.entries:
+            return "added"
+        if self.entries[filename] != entry or not (self.output_folder / filename).exists():
+            return "changed"
+        return "unchanged"
+    
+    def stale(self, present):
+        """Letters in the manifest whose recipient is not among the present filenames any more."""
+        return [filename for filename in self.entries if filename not in present]
+    
+    def remove(self, filenames):
+        """Delete letters of recipients who are no longer in the CSV."""
+        for filename in filenames:
+            (self.output_folder / filename).unlink(missing_ok=True)
+            del self.entries[filename]
+    
+    def record(self, result, wanted):
+        """Record one rendered letter. Failed letters are dropped from the manifest so the
+        next run retries them."""
+        if result["error"]:
+            self.entries.pop(result["filename"], None)
+        else:
+            self.entries[result["filename"]] = wanted[result["filename"]]
     
+    def save(self):
+        """Write the manifest next to the letters."""
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=2, sort_keys=True)
+
+
+def print_manifest_plan(plan):
+    """Print how many letters are added, changed, unchanged and removed in this run."""
+    print(
+        f"Letters: {len(plan['added'])} added, {len(plan['changed'])} changed, "
+        f"{len(plan['unchanged'])} unchanged, {len(plan['removed'])} removed"
+    )
+
+
+def safe_filename(name):
+    """Make a recipient name usable as a file name."""
+    return name.replace(" ", "_").replace("/", "-").replace('"', '')
+
+
+def save_letter(letter_generator, data, today_date, output_path):
+    """Create the letter for one processed individual and save it.
+    
+    With output_path None the .docx is returned as bytes instead of being written.
+    Otherwise the number of bytes written is returned.
+    """
+    doc = letter_generator.create_letter(
+        data["recipient"],
+        data["plots"],
+        data["projects"],
+        today_date
+    )
+    if VALIDATE_LETTERS:
+        problems = letter_generator.validate_letter(doc, data["projects"])
+        if problems:
+            raise ValueError("letter failed validation: " + "; ".join(problems))
+    package = doc.part.package
+    if output_path is None:
+        return letter_generator.zip_writer.to_bytes(package)
+    return letter_generator.zip_writer.write(output_path, package)
+
+
+def render_job(letter_generator, job):
+    """Render one (output_path, data, today_date) job, reporting errors instead of raising."""
+    output_path, data, today_date = job
+    started = time.perf_counter()
+    result = {
+        "worker": os.getpid(),
+        "filename": Path(output_path).name,
+        "projects": len(data["projects"]),
+        "plots": len(data["plots"]),
+        "bytes": 0,
+        "error": None
+    }
+    try:
+        if LETTERS_ZIP:
+            result["docx"] = save_letter(letter_generator, data, today_date, None)
+            result["bytes"] = len(result["docx"])
+        else:
+            result["bytes"] = save_letter(letter_generator, data, today_date, output_path)
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+        result["traceback"] = traceback.format_exc()
+    result["seconds"] = time.perf_counter() - started
+    return result
+
+
+# Each process loads every template once (keyed by template hash) and reuses it for all of its letters
+_worker_generators = {}
+
+
+def worker_generator(template_hash, template_path):
+    """This process's generator for a template, loaded on first use."""
+    if template_hash not in _worker_generators:
+        _worker_generators[template_hash] = LetterGenerator(template_path)
+    return _worker_generators[template_hash]
+
+
+def render_job_in_worker(stage_job):
+    """Process pool task: render one (stage index, template hash, template path, job) with this process's generator."""
+    stage_index, template_hash, template_path, job = stage_job
+    result = render_job(worker_generator(template_hash, template_path), job)
+    result["stage"] = stage_index
+    return result
+
+
+def print_result(result):
+    """Print the progress line for one rendered letter."""
+    if result["error"]:
+        print(f"Error creating {result['filename']}: {result['error']}")
+    else:
+        print(f"Created document: {result['filename']} (with {result['projects']} projects and {result['plots']} plots)")
+
+
+def print_worker_summary(results):
+    """Print letters, errors and rendering time per worker. Returns the number of letters created."""
+    workers = {}
+    errors = []
+    
+    for result in results:
+        stats = workers.setdefault(result["worker"], {"letters": 0, "errors": 0, "seconds": 0.0, "bytes": 0})
+        stats["seconds"] += result["seconds"]
+        stats["bytes"] += result["bytes"]
+        if result["error"]:
+            stats["errors"] += 1
+            errors.append(result)
+        else:
+            stats["letters"] += 1
+    
+    print("\nWorker summary:")
+    for worker, stats in workers.items():
+        print(f"  Worker {worker}: {stats['letters']} letters, {stats['errors']} errors, {stats['seconds']:.1f}s rendering, {stats['bytes'] / 1024 / 1024:.1f} MB written")
+    if errors:
+        print(f"\n{len(errors)} letters failed:")
+        for result in errors:
+            print(f"  {result['filename']}: {result['error']}")
+    
+    return sum(stats["letters"] for stats in workers.values())
+
+
+def archive_letter(archive, result):
+    """Add a rendered letter to the combined archive."""
+    docx_bytes = result.pop("docx", None)
+    if docx_bytes is not None:
+        # .docx files are already compressed, storing them again is enough
+        archive.writestr(result["filename"], docx_bytes, compress_type=zipfile.ZIP_STORED)
+
+
+def report_results(results):
+    """Print progress as results arrive, then the per-worker summary. Returns the number of letters created."""
+    collected = []
+    for result in results:
+        print_result(result)
+        collected.append(result)
+    return print_worker_summary(collected)
+
+
+def get_stages():
+    """Stages listed in DIR_ETAPAS_X environment variables (any X), falling back to DIR_ETAPAS.
+    
+    Each stage may use its own template through TEMPLATE_FILE_NAME_X, TEMPLATE_FILE_NAME is the default.
+    Returns (name, stage directory, template file name) tuples.
+    """
+    default_template = os.environ.get("TEMPLATE_FILE_NAME")
+    stages = []
+    pattern = re.compile(r"^DIR_ETAPAS_(\d+)$")
+    for key, value in os.environ.items():
+        match = pattern.match(key)
+        if match and value:
+            template_filename = os.environ.get(f"TEMPLATE_FILE_NAME_{match.group(1)}") or default_template
+            stages.append((int(match.group(1)), key, value, template_filename))
+    # Sort by number for predictable order
+    stages.sort()
+    if not stages and os.environ.get("DIR_ETAPAS"):
+        return [("DIR_ETAPAS", os.environ["DIR_ETAPAS"], default_template)]
+    return [(key, value, template_filename) for _, key, value, template_filename in stages]
+
+
+def load_stage(name, etapas_dir, template_filename, csv_filename):
+    """Check a stage's files, index its CSV and name its letters, without touching the letters folder.
+    
+    Returns None if files are missing.
+    """
     etapas_path = Path(etapas_dir)
     template_path = etapas_path / template_filename
     csv_path = etapas_path / csv_filename
     
     # Check if files exist
     if not template_path.exists() or not csv_path.exists():
-        print(f"Error: Required files not found.")
+        print(f"Error: Required files not found for {name}.")
         print(f"Template: {template_path} - {'Exists' if template_path.exists() else 'Missing'}")
         print(f"CSV: {csv_path} - {'Exists' if csv_path.exists() else 'Missing'}")
-        exit(1)
+        return None
     
+    print(f"\n{name}: {etapas_path}")
     print(f"Using template: {template_path}")
     print(f"Reading data from: {csv_path}")
     
-    # Create output folder
-    output_folder = etapas_path / "letters"
-    output_folder.mkdir(exist_ok=True)
+    csv_processor = CsvProcessor(csv_path, CSV_DELIMITER)
+    individuals = csv_processor.read_data()
+    print(f"Found {len(individuals)} unique individuals/companies")
     
-    # Get today's date
-    today_date = date.today().strftime("%Y-%m-%d")
+    return {
+        "name": name,
+        "template_path": template_path,
+        "template_hash": file_hash(template_path),
+        "csv_processor": csv_processor,
+        "individuals": individuals,
+        "groups": individuals,
+        "output_names": csv_processor.output_names(individuals),
+        "output_folder": etapas_path / "letters",
+        "merged": 0,
+    }
+
+
+def prepare_stage(name, etapas_dir, template_filename, csv_filename):
+    """Load a stage for generation: create its letters folder and load its manifest. Returns None if files are missing."""
+    stage = load_stage(name, etapas_dir, template_filename, csv_filename)
+    if stage is None:
+        return None
     
-    # Initialize processors
-    csv_processor = CsvProcessor(csv_path)
-    letter_generator = LetterGenerator(template_path)
+    stage["output_folder"].mkdir(exist_ok=True)
+    stage.update({
+        "manifest": None if LETTERS_ZIP else LetterManifest(stage["output_folder"], stage["template_path"]),
+        "archive": None,
+        "wanted": {},
+        "plan": None,
+        "letters": 0,
+        "errors": 0
+    })
+    return stage
+
+
+def merge_recipients(stages):
+    """Give a recipient who appears in several stages with the same template one letter.
     
-    # Read individual data
-    individuals = csv_processor.read_data()
-    print(f"Found {len(individuals)} unique individuals/companies")
+    The letter is written in the first of those stages and lists the projects and plots of
+    all of them; the later stages skip that recipient. Rows stay in the stage CSVs, the merged
+    groups only point at each stage's row index.
+    """
+    owners = {}
+    for stage in stages:
+        stage["groups"] = MergedRowIndex()
+    for stage in stages:
+        for individual_key in stage["individuals"]:
+            owner = owners.setdefault((stage["template_hash"], individual_key), stage)
+            owner["groups"].add(individual_key, stage["individuals"])
+            if owner is not stage:
+                stage["merged"] += 1
+
+
+def stage_jobs(stage_index, stage, today_date):
+    """Yield the render jobs of one stage as its recipients are read from the CSV, leaving out
+    letters the manifest shows are up to date.
     
-    # Process each individual
-    processed_count = 0
+    Once the whole stage has been read, letters of recipients no longer in the CSV are removed.
+    A recipient still in the CSV keeps their letter even if their rows now lack data for a new one.
+    """
+    csv_processor = stage["csv_processor"]
+    manifest = stage["manifest"]
+    plan = {"added": [], "changed": [], "unchanged": [], "removed": []} if manifest else None
+    stage["plan"] = plan
+    present = set()
     
-    for individual_key, individual_rows in individuals.items():
+    for individual_key, individual_rows in stage["groups"].items():
         vardas, pavarde, _ = individual_key
+        filename = stage["output_names"][individual_key]
+        present.add(filename)
+        
+        # Only re-render letters whose rows, template or generator changed since the last run
+        if manifest:
+            entry = manifest.entry(individual_rows)
+            status = manifest.classify(filename, entry)
+            if status == "unchanged":
+                # the same rows produced this letter before, so they have the data it needs
+                stage["wanted"][filename] = entry
+                plan["unchanged"].append(filename)
+                if not FULL_RUN:
+                    continue
         
         # Process data for this individual
         data = csv_processor.process_individual(individual_key, individual_rows)
         if not data:
-            print(f"Skipping {vardas} {pavarde} - insufficient data")
+            if manifest and filename in manifest.entries:
+                print(f"WARNING: Skipping {vardas} {pavarde} - insufficient data, keeping their existing letter {filename}")
+            else:
+                print(f"Skipping {vardas} {pavarde} - insufficient data")
             continue
-            
-        # Create document
-        doc = letter_generator.create_letter(
-            data["recipient"],
-            data["plots"],
-            data["projects"],
-            today_date
-        )
-        
-        # Generate filename and save
-        safe_name = data["recipient"]["name"].replace(" ", "_").replace("/", "-").replace('"', '')
-        output_filename = f"{safe_name}.docx"
-        output_path = output_folder / output_filename
         
-        doc.save(output_path)
-        processed_count += 1
-        
-        print(f"Created document: {output_filename} (with {len(data['projects'])} projects and {len(data['plots'])} plots)")
+        if manifest and status != "unchanged":
+            stage["wanted"][filename] = entry
+            plan[status].append(filename)
+        job = (str(stage["output_folder"] / filename), data, today_date)
+        yield (stage_index, stage["template_hash"], str(stage["template_path"]), job)
     
-    print(f"\nGenerated {processed_count} documents in: {output_folder}")
+    if manifest:
+        plan["removed"] = manifest.stale(present)
+        manifest.remove(plan["removed"])
+        print(f"{stage['name']}: ", end="")
+        print_manifest_plan(plan)
+
 
+def render_chunk_in_worker(stage_jobs):
+    """Process pool task: render a list of stage jobs."""
+    return [render_job_in_worker(stage_job) for stage_job in stage_jobs]
+
+
+def map_in_chunks(executor, jobs, chunksize, window):
+    """Render jobs across the pool in order, like executor.map, but take jobs from the iterator
+    only as results come back: at most `window` chunks are waiting at any time."""
+    pending = []
+    chunks = iter(lambda: list(islice(jobs, chunksize)), [])
+    for chunk in chunks:
+        pending.append(executor.submit(render_chunk_in_worker, chunk))
+        if len(pending) >= window:
+            yield from pending.pop(0).result()
+    for future in pending:
+        yield from future.result()
+
+
+def print_stage_summary(stages):
+    """Print one consolidated line per stage."""
+    print("\nStage summary:")
+    for stage in stages:
+        line = f"  {stage['name']}: {stage['letters']} letters, {stage['errors']} errors"
+        plan = stage["plan"]
+        if plan:
+            line += (
+                f", {len(plan['added'])} added, {len(plan['changed'])} changed, "
+                f"{len(plan['unchanged'])} unchanged, {len(plan['removed'])} removed"
+            )
+        if stage["merged"]:
+            line += f", {stage['merged']} merged into an earlier stage"
+        target = stage["output_folder"] / LETTERS_ZIP if LETTERS_ZIP else stage["output_folder"]
+        print(f"{line} -> {target}")
+
+
+def main():
+    # Load environment variables
+    csv_filename = os.environ.get("ETAPAS_OUTPUT_FILE_NAME", "aggregated_output.csv")
+    # Number of worker processes for rendering (1 = sequential, 0 = one per CPU)
+    workers = int(os.environ.get("LETTER_WORKERS", "1")) or os.cpu_count()
+    # Recipients in several stages with the same template get one combined letter
+    merge_stages = os.environ.get("MERGE_STAGES", "").lower() in ("1", "true", "yes")
+    
+    stage_list = get_stages()
+    if not stage_list or not all(template_filename for _, _, template_filename in stage_list):
+        print("Please set DIR_ETAPAS (or DIR_ETAPAS_1..N) and TEMPLATE_FILE_NAME in your .env file.")
+        exit(1)
+    
+    stages = [prepare_stage(name, etapas_dir, template_filename, csv_filename)
+              for name, etapas_dir, template_filename in stage_list]
+    if None in stages:
+        exit(1)
+    
+    if merge_stages and len(stages) > 1:
+        merge_recipients(stages)
+    
+    # Get today's date
+    today_date = date.today().strftime("%Y-%m-%d")
+    
+    # Process each individual of every stage; jobs are produced while earlier letters render
+    print()
+    for stage in stages:
+        if LETTERS_ZIP:
+            stage["archive"] = zipfile.ZipFile(stage["output_folder"] / LETTERS_ZIP, "w")
+    jobs = chain.from_iterable(stage_jobs(stage_index, stage, today_date) for stage_index, stage in enumerate(stages))
+    recipients = sum(len(stage["groups"]) for stage in stages)
+    
+    def collect(results):
+        for result in results:
+            stage = stages[result["stage"]]
+            if stage["archive"]:
+                archive_letter(stage["archive"], result)
+            if stage["manifest"]:
+                stage["manifest"].record(result, stage["wanted"])
+            stage["errors" if result["error"] else "letters"] += 1
+            yield result
+    
+    if workers > 1 and recipients > 1:
+        print(f"Rendering letters for {recipients} recipients with {workers} worker processes")
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunksize = max(1, min(64, recipients // (workers * 8)))
+            processed_count = report_results(collect(map_in_chunks(executor, jobs, chunksize, workers * 2)))
+    else:
+        processed_count = report_results(collect(map(render_job_in_worker, jobs)))
+    
+    for stage in stages:
+        if stage["manifest"]:
+            stage["manifest"].save()
+        if stage["archive"]:
+            stage["archive"].close()
+    
+    print_stage_summary(stages)
+    print(f"\nGenerated {processed_count} documents in {len(stages)} stage(s)")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,248 @@
+"""
+Letter Generator Benchmark
+
+Generates a synthetic template (same placeholders and anchors as the real ones, a plot
+table and a signature drawing) and a synthetic aggregated_output.csv, then renders all
+letters with letter-filler.py and reports letters/sec, peak RSS and how the time inside
+create_letter is split between its steps. No personal data is needed.
+
+Usage:
+    python letter_benchmark.py [--people 200] [--projects 3] [--plots 6] [--filler 0] [--keep DIR]
+"""
+
+from pathlib import Path
+import argparse
+import csv
+import io
+import random
+import struct
+import sys
+import tempfile
+import time
+import zlib
+from collections import defaultdict
+from datetime import date
+
+from docx import Document
+from docx.shared import Cm
+
+from pipeline import load_script
+
+# Steps of LetterGenerator.create_letter that are timed separately
+CREATE_LETTER_STEPS = (
+    "_apply_replacements",
+    "_fill_table_with_plots",
+    "_add_project_descriptions",
+    "_add_attestation_paragraphs",
+    "_add_signature_content",
+    "_ensure_email_in_document",
+)
+
+CSV_HEADER = [
+    "Registro Nr", "Sklypo adresas", "Unikalus Nr", "Kadastro Nr", "Rolė", "Vardas", "Pavardė",
+    "ĮK/Data", "Tipas", "Elektrinės Nr", "Projekto Nr", "Projekto pavadinimas",
+    "Deklaruotas adresas", "Pašto kodas"
+]
+
+
+# ===== Synthetic input =====
+
+def signature_png(width=40, height=16):
+    """A small solid PNG used as the signature drawing."""
+    raw = b"".join(b"\x00" + b"\x20\x40\x90" * width for _ in range(height))
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(raw))
+        + chunk(b"IEND", b"")
+    )
+
+
+def make_template(path, filler=0):
+    """Write a template with every placeholder and anchor letter-filler.py relies on.
+
+    filler adds that many plain paragraphs before the project paragraph, to simulate
+    longer templates.
+    """
+    doc = Document()
+    doc.add_paragraph("gavejas_1")
+    doc.add_paragraph("adresas_2")
+    doc.add_paragraph("pasto_kodas_3")
+    doc.add_paragraph("")
+    doc.add_paragraph("Data: proj_data")
+    doc.add_paragraph().add_run("DĖL VĖJO ELEKTRINIŲ PROJEKTINIŲ PASIŪLYMŲ").bold = True
+    for i in range(filler):
+        doc.add_paragraph(f"Papildoma pastraipa {i}, kurioje nėra jokių žymų.")
+    doc.add_paragraph("„proj_pav_5\";")
+    doc.add_paragraph("Vėjo elektrinės elektrines_numeris_11 statomos jūsų žemės sklypo kaimynystėje.")
+
+    table = doc.add_table(rows=2, cols=4)
+    table.style = "Table Grid"
+    for cell, title in zip(table.rows[0].cells, ["Registro Nr.", "Unikalus Nr.", "Kadastro Nr.", "Sklypo adresas"]):
+        cell.text = title
+    for cell in table.rows[1].cells:
+        cell.text = ""
+
+    doc.add_paragraph("Informacija apie projektinius pasiūlymus skelbiama savivaldybės svetainėje.")
+    doc.add_paragraph("Šis pranešimas yra informacinio pobūdžio.")
+    doc.add_paragraph("Pridedama:")
+    bullet = doc.add_paragraph("Skelbimas apie energijos gamybos projektinių pasiūlymų viešinimą (2 lapai);", style="List Bullet")
+    num_pr = bullet._p.get_or_add_pPr().get_or_add_numPr()
+    num_pr.get_or_add_ilvl().val = 0
+    num_pr.get_or_add_numId().val = 1
+    doc.add_paragraph("")
+    doc.add_paragraph("Pagarbiai,")
+    signature = doc.add_paragraph()
+    signature.add_run().add_picture(io.BytesIO(signature_png()), width=Cm(3))
+    signature.add_run(" Projekto vadovas Vardenis Pavardenis").italic = True
+    doc.add_paragraph("El. p.: info@example.com")
+    doc.save(path)
+
+
+def make_csv(path, people=200, max_projects=3, max_plots=6, seed=1):
+    """Write an aggregated_output.csv with random people, companies, projects and plots."""
+    rnd = random.Random(seed)
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_HEADER)
+        for i in range(people):
+            company = rnd.random() < 0.2
+            vardas = f"UAB Įmonė {i}" if company else f"Vardas{i}"
+            pavarde = "" if company else f"Pavardė{i}"
+            id_or_date = f"30{i:07d}" if company else f"19{rnd.randint(40, 99)}-01-01"
+            tipas = "juridinis" if company else "fizinis"
+            for _ in range(rnd.randint(1, max_projects)):
+                ve = f"VE{rnd.randint(1, 60)}"
+                for plot in range(rnd.randint(1, max_plots)):
+                    writer.writerow([
+                        f"44/{i}-{plot}", f"Kaimas {plot}, Rokiškio r.", f"4400-{i:04d}-{plot:04d}", f"7330/000{plot}:{i}",
+                        "Savininkas", vardas, pavarde, id_or_date, tipas,
+                        ve, f"P-{ve}", f"Rokiškio r. sav., {ve} vėjo elektrinė",
+                        f"Gatvė {i}, Rokiškis", f"LT-{42000 + i}"
+                    ])
+
+
+# ===== Measurement =====
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None where it is not available."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def time_steps(letter_generator, timings):
+    """Wrap the create_letter steps of one generator so their time is added to timings."""
+    def timed(name, method):
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                timings[name] += time.perf_counter() - started
+        return wrapper
+
+    for name in CREATE_LETTER_STEPS:
+        setattr(letter_generator, name, timed(name, getattr(letter_generator, name)))
+    cache = letter_generator.template_cache
+    cache.clone = timed("clone", cache.clone)
+    index = letter_generator.template_index
+    index.resolve_anchors = timed("resolve_anchors", index.resolve_anchors)
+
+
+def run_benchmark(workdir, args):
+    filler = load_script("letter_filler", "letter-filler.py")
+    template_path = workdir / "template.docx"
+    csv_path = workdir / "aggregated_output.csv"
+    output_folder = workdir / "letters"
+    output_folder.mkdir(exist_ok=True)
+
+    make_template(template_path, args.filler)
+    make_csv(csv_path, args.people, args.projects, args.plots, args.seed)
+
+    started = time.perf_counter()
+    letter_generator = filler.LetterGenerator(template_path)
+    template_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    csv_processor = filler.CsvProcessor(csv_path)
+    individuals = csv_processor.read_data()
+    output_names = csv_processor.output_names(individuals)
+    jobs = []
+    for individual_key, individual_rows in individuals.items():
+        data = csv_processor.process_individual(individual_key, individual_rows)
+        if data:
+            jobs.append((output_folder / output_names[individual_key], data))
+    csv_seconds = time.perf_counter() - started
+
+    timings = defaultdict(float)
+    time_steps(letter_generator, timings)
+    today_date = date.today().strftime("%Y-%m-%d")
+    bytes_written = 0
+
+    started = time.perf_counter()
+    for output_path, data in jobs:
+        step_started = time.perf_counter()
+        doc = letter_generator.create_letter(data["recipient"], data["plots"], data["projects"], today_date)
+        timings["create_letter"] += time.perf_counter() - step_started
+
+        step_started = time.perf_counter()
+        bytes_written += letter_generator.zip_writer.write(output_path, doc.part.package)
+        timings["save"] += time.perf_counter() - step_started
+    render_seconds = time.perf_counter() - started
+
+    letters = len(jobs)
+    projects = sum(len(data["projects"]) for _, data in jobs)
+    plots = sum(len(data["plots"]) for _, data in jobs)
+    rss = peak_rss_mb()
+
+    print(f"Letters: {letters} ({projects} projects, {plots} plots, {args.filler} filler paragraphs)")
+    print(f"Template load: {template_seconds * 1000:.1f} ms")
+    print(f"CSV read + grouping: {csv_seconds * 1000:.1f} ms")
+    print(f"Rendering: {render_seconds:.2f} s, {letters / render_seconds if render_seconds else 0:.1f} letters/sec, "
+          f"{render_seconds / letters * 1000 if letters else 0:.2f} ms/letter")
+    print(f"Written: {bytes_written / 1024 / 1024:.1f} MB")
+    print(f"Peak RSS: {f'{rss:.1f} MB' if rss is not None else 'n/a'}")
+
+    if not letters:
+        print("\nNo letters rendered, nothing to split.")
+        return
+
+    print("\nTime split per letter:")
+    print(f"  {'step':<30} {'ms/letter':>10} {'share':>7}")
+    total = timings["create_letter"] + timings["save"]
+    steps = ("clone", "resolve_anchors") + CREATE_LETTER_STEPS
+    other = timings["create_letter"] - sum(timings[name] for name in steps)
+    rows = [(name, timings[name]) for name in steps] + [("other (create_letter)", other), ("save", timings["save"])]
+    for name, seconds in rows:
+        print(f"  {name:<30} {seconds / letters * 1000:>10.3f} {seconds / total * 100 if total else 0:>6.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark letter-filler.py on synthetic data.")
+    parser.add_argument("--people", type=int, default=200, help="number of recipients")
+    parser.add_argument("--projects", type=int, default=3, help="maximum projects per recipient")
+    parser.add_argument("--plots", type=int, default=6, help="maximum plots per project")
+    parser.add_argument("--filler", type=int, default=0, help="extra plain paragraphs in the template")
+    parser.add_argument("--seed", type=int, default=1, help="random seed for the CSV")
+    parser.add_argument("--keep", type=Path, help="write template, CSV and letters here instead of a temp dir")
+    args = parser.parse_args()
+
+    if args.keep:
+        args.keep.mkdir(parents=True, exist_ok=True)
+        run_benchmark(args.keep, args)
+    else:
+        with tempfile.TemporaryDirectory() as workdir:
+            run_benchmark(Path(workdir), args)
+
+
+if __name__ == "__main__":
+    main()
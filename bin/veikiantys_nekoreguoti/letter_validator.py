@@ -0,0 +1,260 @@
+"""
+Letter Validator
+
+Checks every generated letter of every stage (DIR_ETAPAS or DIR_ETAPAS_1..N) against the
+stage's CSV, without opening the letters in Word:
+
+- no template placeholder (gavejas_1, adresas_2, proj_pav_5, ...) is left in the text
+- the plot table has one row per plot of the recipient
+- "Pridedama:" is followed by one attestation bullet per VE, in ascending VE order
+
+Each letter's word/document.xml is streamed straight from the zip, and letters are checked
+across a process pool. Failures are printed as a table and the exit status is 1.
+
+Usage:
+    python letter_validator.py [--workers 0]
+"""
+
+import argparse
+import io
+import os
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from dotenv import load_dotenv
+from lxml import etree
+
+from pipeline import load_script
+
+load_dotenv()
+
+# Shares the stage loading and the attestation / VE helpers with the generator
+filler = load_script("letter_filler", "letter-filler.py")
+
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+W_BODY = f"{{{W_NS}}}body"
+W_P = f"{{{W_NS}}}p"
+W_T = f"{{{W_NS}}}t"
+W_TBL = f"{{{W_NS}}}tbl"
+W_TR = f"{{{W_NS}}}tr"
+DOCUMENT_XML = "word/document.xml"
+
+PLACEHOLDERS = (
+    "gavejas_1", "adresas_2", "pasto_kodas_3", "proj_data", "proj_pav_5", "elektrines_numeris_11"
+)
+
+
+# Each process keeps the letter archives it reads from open (LETTERS_ZIP mode)
+_archives = {}
+
+
+def open_letter(path, member=None):
+    """Open a letter .docx, or the letter `member` of a LETTERS_ZIP archive."""
+    if member is None:
+        return zipfile.ZipFile(path)
+    if path not in _archives:
+        _archives[path] = zipfile.ZipFile(path)
+    return zipfile.ZipFile(io.BytesIO(_archives[path].read(member)))
+
+
+def scan_document(zf):
+    """Stream word/document.xml once.
+
+    Returns the placeholders found anywhere in the text, the row count of every top-level
+    table, the texts of the attestation bullets right after the first 'Pridedama:' (None
+    without one) and whether an attestation bullet comes right before it.
+    """
+    placeholders = set()
+    table_rows = []
+    attestations = None
+    bullet_above = False
+    collecting = False
+    previous_text = ""
+
+    with zf.open(DOCUMENT_XML) as f:
+        for _, element in etree.iterparse(f, events=("end",), tag=(W_P, W_TBL)):
+            parent = element.getparent()
+            at_body = parent is not None and parent.tag == W_BODY
+
+            if element.tag == W_P:
+                text = "".join(t.text or "" for t in element.iter(W_T))
+                for placeholder in PLACEHOLDERS:
+                    if placeholder in text:
+                        placeholders.add(placeholder)
+                if at_body:
+                    if collecting:
+                        if filler.is_attestation_text(text):
+                            attestations.append(text)
+                        else:
+                            collecting = False
+                    elif attestations is None and "pridedama:" in text.lower():
+                        attestations = []
+                        bullet_above = filler.is_attestation_text(previous_text)
+                        collecting = True
+                    previous_text = text
+                    element.clear()
+            elif at_body:
+                table_rows.append(sum(1 for _ in element.iterchildren(W_TR)))
+                collecting = False
+                previous_text = ""
+                element.clear()
+
+            # body children that are done are dropped, so memory stays flat
+            if at_body:
+                while element.getprevious() is not None:
+                    del parent[0]
+
+    return placeholders, table_rows, attestations, bullet_above
+
+
+def check_letter(job):
+    """Check one (stage, name, path, archive member, expected) job. Returns [(check, details)] of its problems."""
+    _, _, path, member, expected = job
+    problems = []
+    try:
+        with open_letter(path, member) as zf:
+            placeholders, table_rows, attestations, bullet_above = scan_document(zf)
+    except Exception as e:
+        return [("open", f"{type(e).__name__}: {e}")]
+
+    if placeholders:
+        problems.append(("placeholders", ", ".join(sorted(placeholders))))
+
+    if expected["table_rows"] is not None:
+        rows = table_rows[0] if table_rows else 0
+        if rows != expected["table_rows"]:
+            problems.append(("plot table", f"{rows} rows, expected {expected['table_rows']}"))
+
+    if bullet_above:
+        problems.append(("attestations", "attestation bullet above 'Pridedama:'"))
+
+    ves = expected["ves"]
+    if ves:
+        if attestations is None:
+            problems.append(("attestations", "'Pridedama:' paragraph missing"))
+        elif len(attestations) != len(ves):
+            problems.append(("attestations", f"{len(attestations)} bullets, expected {len(ves)} ({', '.join(ves)})"))
+        else:
+            for ve, text in zip(ves, attestations):
+                if not filler.mentions_ve(text, ve):
+                    problems.append(("attestations", f"bullet for {ve} missing or out of order"))
+                    break
+
+    return problems
+
+
+def stage_checks(stage):
+    """Build the check jobs of one stage: every expected letter, plus letters no recipient has."""
+    with zipfile.ZipFile(stage["template_path"]) as zf:
+        _, template_tables, _, _ = scan_document(zf)
+    # the first plot replaces the template's plot row, the others are added to the table
+    plot_table_rows = template_tables[0] - 1 if template_tables else None
+
+    archive_path = stage["output_folder"] / filler.LETTERS_ZIP if filler.LETTERS_ZIP else None
+    if not (archive_path or stage["output_folder"]).exists():
+        print(f"{stage['name']}: {archive_path or stage['output_folder']} not found, no letters generated yet")
+        present = set()
+    elif archive_path:
+        with zipfile.ZipFile(archive_path) as archive:
+            present = set(archive.namelist())
+    else:
+        present = {
+            entry.name for entry in os.scandir(stage["output_folder"])
+            if entry.name.lower().endswith(".docx") and not entry.name.startswith("~$")
+        }
+
+    jobs = []
+    missing = []
+    expected_names = set()
+    csv_processor = stage["csv_processor"]
+    for individual_key, individual_rows in stage["groups"].items():
+        filename = stage["output_names"][individual_key]
+        # letter-filler keeps the letter of a recipient whose rows now lack data, it is not unexpected
+        expected_names.add(filename)
+        data = csv_processor.process_individual(individual_key, individual_rows)
+        if not data:
+            continue
+        if filename not in present:
+            missing.append(filename)
+            continue
+        expected = {
+            # without plots the template row stays as it is
+            "table_rows": plot_table_rows + max(1, len(data["plots"])) if plot_table_rows is not None else None,
+            "ves": sorted(data["projects"], key=filler.ve_sort_key),
+        }
+        path = archive_path or stage["output_folder"] / filename
+        jobs.append((stage["name"], filename, str(path), filename if archive_path else None, expected))
+
+    unexpected = sorted(present - expected_names)
+    return jobs, missing, unexpected
+
+
+def print_failures(failures):
+    """Print (stage, letter, check, details) rows as a table."""
+    widths = [max(len(row[i]) for row in failures + [("Stage", "Letter", "Check", "")]) for i in range(3)]
+    header = ("Stage", "Letter", "Check", "Details")
+    print("  ".join(value.ljust(width) for value, width in zip(header, widths)) + "  " + header[3])
+    print("  ".join("-" * width for width in widths) + "  " + "-" * 7)
+    for row in failures:
+        print("  ".join(value.ljust(width) for value, width in zip(row, widths)) + "  " + row[3])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check generated letters against the stage CSVs.")
+    parser.add_argument("--workers", type=int, default=0, help="worker processes (0 = one per CPU, 1 = sequential)")
+    args = parser.parse_args()
+    workers = args.workers or os.cpu_count()
+
+    csv_filename = os.environ.get("ETAPAS_OUTPUT_FILE_NAME", "aggregated_output.csv")
+    merge_stages = os.environ.get("MERGE_STAGES", "").lower() in ("1", "true", "yes")
+
+    stage_list = filler.get_stages()
+    if not stage_list or not all(template_filename for _, _, template_filename in stage_list):
+        print("Please set DIR_ETAPAS (or DIR_ETAPAS_1..N) and TEMPLATE_FILE_NAME in your .env file.")
+        exit(1)
+
+    stages = [filler.load_stage(name, etapas_dir, template_filename, csv_filename)
+              for name, etapas_dir, template_filename in stage_list]
+    if None in stages:
+        exit(1)
+    if merge_stages and len(stages) > 1:
+        filler.merge_recipients(stages)
+
+    jobs = []
+    failures = []
+    for stage in stages:
+        stage_jobs, missing, unexpected = stage_checks(stage)
+        jobs.extend(stage_jobs)
+        failures.extend((stage["name"], filename, "missing", "no letter for this recipient") for filename in missing)
+        failures.extend((stage["name"], filename, "unexpected", "no recipient in the CSV") for filename in unexpected)
+
+    started = time.perf_counter()
+    if workers > 1 and len(jobs) > 1:
+        print(f"\nChecking {len(jobs)} letters with {workers} worker processes")
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(check_letter, jobs, chunksize=max(1, len(jobs) // (workers * 8))))
+    else:
+        print(f"\nChecking {len(jobs)} letters")
+        results = list(map(check_letter, jobs))
+    seconds = time.perf_counter() - started
+
+    failed = 0
+    for job, problems in zip(jobs, results):
+        failed += bool(problems)
+        for check, details in problems:
+            failures.append((job[0], job[1], check, details))
+
+    print(f"Checked {len(jobs)} letters in {seconds:.2f} s ({len(jobs) / seconds if seconds else 0:.0f} letters/sec)")
+    if failures:
+        print()
+        print_failures(failures)
+    print(f"\n{len(jobs) - failed} letters OK, {failed} failed checks, "
+          f"{sum(1 for row in failures if row[2] == 'missing')} missing, "
+          f"{sum(1 for row in failures if row[2] == 'unexpected')} unexpected")
+    if failures:
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Pipelined Address Lookup + Letter Generation
+
+Runs address-extractor.py and letter-filler.py as one pipeline: address lookups
+run in the background and every person's letter is rendered as soon as their
+address is resolved, so the letter rendering no longer waits for the last lookup.
+The aggregated CSV is updated at the end exactly like address-extractor.py does.
+"""
+
+from pathlib import Path
+import importlib.util
+import os
+import queue
+import threading
+import zipfile
+from datetime import date
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+
+# How many resolved people may wait for rendering before lookups are paused
+QUEUE_SIZE = int(os.environ.get("PIPELINE_QUEUE_SIZE", "32"))
+
+_DONE = object()
+
+
+def load_script(name, filename):
+    """Import one of the hyphenated scripts in this folder as a module."""
+    spec = importlib.util.spec_from_file_location(name, SCRIPT_DIR / filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def main():
+    extractor = load_script("address_extractor", "address-extractor.py")
+    filler = load_script("letter_filler", "letter-filler.py")
+
+    template_filename = os.environ.get("TEMPLATE_FILE_NAME")
+    if not template_filename:
+        print("Please set DIR_ETAPAS and TEMPLATE_FILE_NAME in your .env file.")
+        exit(1)
+
+    # Same stage loading as letter-filler.py: CSV_DELIMITER (or the sniffed delimiter),
+    # output names and the manifest of the letters folder
+    input_file = extractor.INPUT_FILE
+    stage = filler.prepare_stage("DIR_ETAPAS", extractor.ETAPAS_DIR, template_filename, input_file.name)
+    if stage is None:
+        exit(1)
+    extractor.print_mode_banner()
+
+    output_folder = stage["output_folder"]
+    manifest = stage["manifest"]
+    today_date = date.today().strftime("%Y-%m-%d")
+
+    delimiter = stage["individuals"].delimiter
+    rows = extractor.read_rows(input_file, delimiter)
+    unique_individuals = extractor.find_unique_individuals(rows)
+
+    # Letters are rendered from the rows in memory, which get their addresses before the
+    # CSV is written back
+    csv_processor = stage["csv_processor"]
+    letter_generator = filler.LetterGenerator(stage["template_path"])
+    individuals = csv_processor.group_rows(rows[1:])
+    output_names = stage["output_names"]
+    print(f"Found {len(unique_individuals)} unique individuals requiring address lookup")
+
+    # Bounded queue: lookups block once the renderer falls QUEUE_SIZE people behind
+    ready = queue.Queue(maxsize=QUEUE_SIZE)
+
+    def on_result(person_key, address, postal_code):
+        for i in unique_individuals[person_key]:
+            extractor.apply_address(rows[i], address, postal_code)
+        ready.put(person_key)
+
+    lookup_result = {}
+
+    def produce():
+        try:
+            # Companies and anyone without a lookup can be rendered straight away
+            for individual_key in individuals:
+                if individual_key not in unique_individuals:
+                    ready.put(individual_key)
+
+            cache, unresolved, metrics = extractor.resolve_addresses(unique_individuals, rows, on_result)
+            lookup_result.update(cache=cache, unresolved=unresolved, metrics=metrics)
+
+            # People left unresolved keep whatever address their rows already had
+            for person_key in unresolved:
+                ready.put(person_key)
+        finally:
+            ready.put(_DONE)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+
+    archive = zipfile.ZipFile(output_folder / filler.LETTERS_ZIP, "w") if filler.LETTERS_ZIP else None
+
+    results = []
+    while True:
+        individual_key = ready.get()
+        if individual_key is _DONE:
+            break
+        if individual_key not in individuals:
+            continue
+        vardas, pavarde, _ = individual_key
+
+        data = csv_processor.process_individual(individual_key, individuals[individual_key])
+        if not data:
+            print(f"Skipping {vardas} {pavarde} - insufficient data")
+            continue
+
+        filename = output_names[individual_key]
+        job = (str(output_folder / filename), data, today_date)
+        result = filler.render_job(letter_generator, job)
+        if archive:
+            filler.archive_letter(archive, result)
+        if manifest:
+            # hashed from the rows as they will be written, so the next letter-filler.py run
+            # sees the letter as unchanged
+            stage["wanted"][filename] = manifest.entry(individuals[individual_key])
+            manifest.record(result, stage["wanted"])
+        results.append(result)
+        filler.print_result(result)
+
+    producer.join()
+    if manifest:
+        manifest.save()
+    if archive:
+        archive.close()
+    if not lookup_result:
+        print("Address lookups failed, the CSV file was not updated.")
+        exit(1)
+
+    extractor.write_rows(input_file, rows, delimiter)
+    print(f"\nFile updated: {input_file}")
+    extractor.print_lookup_report(lookup_result["cache"], lookup_result["unresolved"], lookup_result["metrics"])
+    processed_count = filler.print_worker_summary(results)
+    print(f"Generated {processed_count} documents in: {output_folder}")
+
+
+if __name__ == "__main__":
+    main()
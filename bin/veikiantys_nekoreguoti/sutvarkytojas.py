@@ -1,9 +1,15 @@
 from pathlib import Path
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from dotenv import load_dotenv
-from docx import Document
+from lxml import etree
+import hashlib
+import json
 import os
-import copy
 import sys
+import zipfile
+
+from docx_zip import replace_members
 
 load_dotenv()
 
@@ -12,69 +18,190 @@ if not DIR_SUTVARKYMAS:
     print("ENV missing: set DIR_SUTVARKYMAS in .env to the folder with .docx files")
     sys.exit(1)
 
-def is_bullet_para(para):
+# worker processes (1 = sequential, 0 = one per CPU)
+WORKERS = int(os.environ.get("SUTVARKYMAS_WORKERS", "1")) or os.cpu_count()
+
+# size, mtime and hash of every document already checked, kept in the documents folder
+STATE_FILE = ".sutvarkytojas_state.json"
+
+# ignore the state file and check every document again
+FULL_RUN = "--full" in sys.argv
+
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+DOCUMENT_XML = "word/document.xml"
+STYLES_XML = "word/styles.xml"
+
+def w(tag):
+    """Clark-notation name of a WordprocessingML tag or attribute."""
+    return f"{{{W_NS}}}{tag}"
+
+class BulletStyles:
+    """Paragraph styles of one document that count as bullet/list styles, looked up once."""
+
+    def __init__(self, styles_xml):
+        self.style_ids = set()
+        self.bullet_ids = set()
+        self.default_id = None
+        if styles_xml is None:
+            return
+        for style in etree.fromstring(styles_xml).iter(w("style")):
+            if style.get(w("type")) != "paragraph":
+                continue
+            style_id = style.get(w("styleId"))
+            self.style_ids.add(style_id)
+            if style.get(w("default")) in ("1", "true", "on"):
+                self.default_id = style_id
+            name = style.find(w("name"))
+            # style name often contains 'bullet' or 'list'
+            name = ((name.get(w("val")) if name is not None else "") or "").lower()
+            if "bullet" in name or "list" in name:
+                self.bullet_ids.add(style_id)
+
+    def is_bullet_style(self, p):
+        """Whether the paragraph's style (or the default style it falls back to) is a list style."""
+        p_style = p.find(f"{w('pPr')}/{w('pStyle')}")
+        style_id = p_style.get(w("val")) if p_style is not None else None
+        if style_id not in self.style_ids:
+            style_id = self.default_id
+        return style_id in self.bullet_ids
+
+# run children python-docx Run.text turns into text (w:br only as a line break, see paragraph_text)
+RUN_TEXT = {w("tab"): "\t", w("ptab"): "\t", w("cr"): "\n", w("noBreakHyphen"): "-"}
+
+def paragraph_text(p):
+    """Text of a body paragraph (its runs and hyperlinks), like python-docx Paragraph.text."""
+    parts = []
+    for r in p.xpath("./w:r | ./w:hyperlink/w:r", namespaces={"w": W_NS}):
+        for child in r:
+            if child.tag == w("t"):
+                parts.append(child.text or "")
+            elif child.tag == w("br"):
+                # page and column breaks have no text
+                if child.get(w("type"), "textWrapping") == "textWrapping":
+                    parts.append("\n")
+            elif child.tag in RUN_TEXT:
+                parts.append(RUN_TEXT[child.tag])
+    return "".join(parts)
+
+def is_bullet_para(p, text, styles):
     """Heuristics to detect a bullet/list paragraph."""
-    text = (para.text or "").strip()
+    text = text.strip()
     if not text:
         return False
     # common visible bullet char
     if text.startswith("•") or text.startswith("-"):
         return True
-    # style name often contains 'bullet' or 'list'
-    try:
-        style_name = (para.style.name or "").lower()
-        if "bullet" in style_name or "list" in style_name:
-            return True
-    except Exception:
-        pass
-    # try to detect numbering in the underlying XML (numPr present)
-    try:
-        pPr = para._p.pPr  # may raise AttributeError
-        if pPr is not None and getattr(pPr, "numPr", None) is not None:
-            return True
-    except Exception:
-        pass
-    return False
+    if styles.is_bullet_style(p):
+        return True
+    # numbering in the paragraph properties (numPr present)
+    return p.find(f"{w('pPr')}/{w('numPr')}") is not None
 
-def move_pridedama_before_bullets(doc_path: Path):
-    doc = Document(doc_path)
-    paras = list(doc.paragraphs)
-    changed = False
+def fix_document_xml(document_xml, styles):
+    """Move every 'Pridedama:' paragraph above the bullet block right before it, in one pass.
+    Returns the new document.xml, or None if nothing had to move."""
+    root = etree.fromstring(document_xml)
+    body = root.find(w("body"))
+    paras = [child for child in body if child.tag == w("p")]
+    texts = [paragraph_text(p) for p in paras]
+    # bullet checks are only needed right before a 'Pridedama:' paragraph, done on first use
+    bullets = [None] * len(paras)
 
-    # find all paragraphs that contain 'Pridedama:' (case-insensitive)
-    pr_indices = [i for i, p in enumerate(paras) if "pridedama:" in (p.text or "").lower()]
+    def is_bullet(i):
+        if bullets[i] is None:
+            bullets[i] = is_bullet_para(paras[i], texts[i], styles)
+        return bullets[i]
 
-    # process from last to first to avoid index shift issues
-    for pr_idx in reversed(pr_indices):
-        # find contiguous bullet block immediately before pr_idx
-        start = pr_idx - 1
-        if start < 0:
+    changed = False
+
+    # process from last to first, earlier paragraphs keep their positions
+    for pr_idx in reversed(range(len(paras))):
+        if "pridedama:" not in texts[pr_idx].lower():
             continue
-        # move backwards while paragraphs are bullets (stop at first non-bullet)
-        while start >= 0 and is_bullet_para(paras[start]):
+        # find contiguous bullet block immediately before pr_idx (stop at first non-bullet)
+        start = pr_idx - 1
+        while start >= 0 and is_bullet(start):
             start -= 1
         first_bullet_idx = start + 1
 
-        # if there is at least one bullet before Pridedama, move Pridedama to before first_bullet_idx
+        # if there is at least one bullet before Pridedama, move Pridedama to before the first bullet
         if first_bullet_idx <= pr_idx - 1:
-            pr_para = paras[pr_idx]
-            # copy element and insert before the first bullet
-            pr_elem = pr_para._p
-            pr_copy = copy.deepcopy(pr_elem)
-            doc._body._element.insert(first_bullet_idx, pr_copy)
-            # remove the original pr element (it may have shifted; remove by reference)
-            parent = pr_elem.getparent()
-            if parent is not None:
-                parent.remove(pr_elem)
+            paras[first_bullet_idx].addprevious(paras[pr_idx])
+            for values in (paras, texts, bullets):
+                values.insert(first_bullet_idx, values.pop(pr_idx))
             changed = True
-            # refresh paras list for subsequent iterations
-            paras = list(doc.paragraphs)
 
-    if changed:
-        doc.save(doc_path)
-        print(f"Fixed: {doc_path.name}")
-    else:
-        print(f"No change: {doc_path.name}")
+    if not changed:
+        return None
+    return etree.tostring(root, xml_declaration=True, encoding="UTF-8", standalone=True)
+
+# letters made from one template share styles.xml, so its bullet styles are looked up once
+_bullet_styles_cache = {}
+
+def bullet_styles(zf):
+    """BulletStyles of an open .docx, cached by the CRC and size of its styles part."""
+    try:
+        info = zf.getinfo(STYLES_XML)
+    except KeyError:
+        return BulletStyles(None)
+    key = (info.CRC, info.file_size)
+    if key not in _bullet_styles_cache:
+        _bullet_styles_cache[key] = BulletStyles(zf.read(STYLES_XML))
+    return _bullet_styles_cache[key]
+
+def move_pridedama_before_bullets(doc_path: Path):
+    """Fix one document in place. Only word/document.xml is rewritten, other parts are copied verbatim.
+    Returns True if the document was changed."""
+    with zipfile.ZipFile(doc_path) as zf:
+        document_xml = zf.read(DOCUMENT_XML)
+        styles = bullet_styles(zf)
+
+    fixed_xml = fix_document_xml(document_xml, styles)
+    if fixed_xml is not None:
+        replace_members(doc_path, {DOCUMENT_XML: fixed_xml})
+        return True
+    return False
+
+def file_hash(path):
+    """sha256 of a file's contents."""
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def process_document(job):
+    """Check and fix one (path, known content hash) job. Returns a result dict, errors included."""
+    doc_path, known_hash = job
+    result = {"name": doc_path.name, "status": None, "error": None}
+    try:
+        # touched or copied but the content is what we already checked
+        content_hash = file_hash(doc_path) if known_hash else None
+        if content_hash and content_hash == known_hash:
+            result["status"] = "unchanged"
+        elif move_pridedama_before_bullets(doc_path):
+            result["status"] = "fixed"
+            content_hash = None
+        else:
+            result["status"] = "no change"
+        stat = doc_path.stat()
+        result.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns, hash=content_hash or file_hash(doc_path))
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = str(e)
+    return result
+
+def load_state(state_path):
+    """{file name: {size, mtime_ns, hash}} of documents checked on earlier runs."""
+    if FULL_RUN or not state_path.exists():
+        return {}
+    try:
+        with open(state_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_state(state_path, state):
+    tmp_path = state_path.with_name(state_path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, state_path)
 
 def main():
     folder = Path(DIR_SUTVARKYMAS)
@@ -82,16 +209,67 @@ def main():
         print(f"Path not found or not a directory: {folder}")
         return
 
-    docx_files = list(folder.glob("*.docx"))
-    if not docx_files:
+    # one directory listing gives name, size and mtime of every document (~$ files are Word lock files)
+    entries = sorted(
+        (entry for entry in os.scandir(folder)
+         if entry.is_file() and entry.name.lower().endswith(".docx") and not entry.name.startswith("~$")),
+        key=lambda entry: entry.name
+    )
+    if not entries:
         print("No .docx files found in folder.")
         return
 
-    for f in docx_files:
-        try:
-            move_pridedama_before_bullets(f)
-        except Exception as e:
-            print(f"Error processing {f.name}: {e}")
+    state_path = folder / STATE_FILE
+    state = load_state(state_path)
+
+    # documents with the same size and mtime as last time are skipped without being opened
+    jobs = []
+    skipped = 0
+    for entry in entries:
+        known = state.get(entry.name)
+        stat = entry.stat()
+        if known and known["size"] == stat.st_size and known["mtime_ns"] == stat.st_mtime_ns:
+            skipped += 1
+            continue
+        jobs.append((Path(entry.path), known["hash"] if known else None))
+
+    counts = Counter()
+
+    def record(results):
+        for result in results:
+            counts[result["status"]] += 1
+            if result["status"] == "error":
+                print(f"Error processing {result['name']}: {result['error']}")
+                state.pop(result["name"], None)
+                continue
+            if result["status"] == "fixed":
+                print(f"Fixed: {result['name']}")
+            elif result["status"] == "no change":
+                print(f"No change: {result['name']}")
+            state[result["name"]] = {key: result[key] for key in ("size", "mtime_ns", "hash")}
+
+    try:
+        if WORKERS > 1 and len(jobs) > 1:
+            print(f"Checking {len(jobs)} documents with {WORKERS} worker processes")
+            with ProcessPoolExecutor(max_workers=WORKERS) as executor:
+                try:
+                    record(executor.map(process_document, jobs, chunksize=max(1, len(jobs) // (WORKERS * 8))))
+                except BaseException:
+                    # don't wait for the documents nobody will look at
+                    executor.shutdown(cancel_futures=True)
+                    raise
+        else:
+            record(map(process_document, jobs))
+    finally:
+        # documents checked so far are remembered even if the run stops early;
+        # documents that are no longer in the folder are forgotten
+        present = {entry.name for entry in entries}
+        save_state(state_path, {name: known for name, known in state.items() if name in present})
+
+    print(
+        f"\n{counts['fixed']} fixed, {counts['no change']} no change, "
+        f"{skipped + counts['unchanged']} unchanged since last run, {counts['error']} errors"
+    )
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
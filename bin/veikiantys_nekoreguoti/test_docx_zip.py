@@ -0,0 +1,72 @@
+"""
+Checks that letters written through DocxZipWriter open and keep their content.
+
+Usage:
+    python -m pytest test_docx_zip.py
+"""
+
+import io
+import re
+import zipfile
+
+from docx import Document
+
+import letter_benchmark
+from pipeline import load_script
+
+filler = load_script("letter_filler", "letter-filler.py")
+
+
+def without_styles(source, target):
+    """Copy a .docx without word/styles.xml (as some generators write them)."""
+    with zipfile.ZipFile(source) as src, zipfile.ZipFile(target, "w", zipfile.ZIP_DEFLATED) as dst:
+        for info in src.infolist():
+            if info.filename == "word/styles.xml":
+                continue
+            data = src.read(info.filename)
+            if info.filename == "word/_rels/document.xml.rels":
+                data = re.sub(rb'<Relationship [^>]*Target="styles.xml"/>', b"", data)
+            elif info.filename == "[Content_Types].xml":
+                data = re.sub(rb'<Override PartName="/word/styles.xml"[^>]*/>', b"", data)
+            dst.writestr(info, data)
+
+
+def render_letters(template_path, csv_path):
+    csv_processor = filler.CsvProcessor(csv_path)
+    individuals = csv_processor.read_data()
+    letter_generator = filler.LetterGenerator(template_path)
+    letters = []
+    for individual_key, individual_rows in individuals.items():
+        data = csv_processor.process_individual(individual_key, individual_rows)
+        letters.append((data, filler.save_letter(letter_generator, data, "2026-01-01", None)))
+    return letters
+
+
+def test_template_without_styles_part(tmp_path):
+    letter_benchmark.make_template(tmp_path / "full.docx")
+    without_styles(tmp_path / "full.docx", tmp_path / "template.docx")
+    letter_benchmark.make_csv(tmp_path / "aggregated_output.csv", people=10)
+
+    letters = render_letters(tmp_path / "template.docx", tmp_path / "aggregated_output.csv")
+
+    assert len(letters) == 10
+    for data, blob in letters:
+        with zipfile.ZipFile(io.BytesIO(blob)) as zf:
+            assert zf.testzip() is None
+            assert "word/styles.xml" in zf.namelist()
+        text = "\n".join(p.text for p in Document(io.BytesIO(blob)).paragraphs)
+        assert data["recipient"]["name"] in text
+        assert "gavejas_1" not in text
+
+
+def test_unchanged_parts_are_copied(tmp_path):
+    letter_benchmark.make_template(tmp_path / "template.docx")
+    letter_benchmark.make_csv(tmp_path / "aggregated_output.csv", people=3)
+
+    letters = render_letters(tmp_path / "template.docx", tmp_path / "aggregated_output.csv")
+
+    with zipfile.ZipFile(tmp_path / "template.docx") as template:
+        template_styles = template.getinfo("word/styles.xml").CRC
+    for _, blob in letters:
+        with zipfile.ZipFile(io.BytesIO(blob)) as zf:
+            assert zf.getinfo("word/styles.xml").CRC == template_styles
@@ -0,0 +1,47 @@
+"""
+Checks that letter_validator.py agrees with letter-filler.py about which letters should exist.
+
+Usage:
+    python -m pytest test_letter_validator.py
+"""
+
+import csv
+
+import letter_benchmark
+import letter_validator
+
+filler = letter_validator.filler
+
+
+def blank_address(csv_path):
+    """Blank the address columns of the first recipient, the way a failed lookup could."""
+    with open(csv_path, newline="", encoding="utf-8-sig") as f:
+        rows = list(csv.reader(f))
+    key = filler.CsvProcessor.individual_key(rows[1])
+    for row in rows[1:]:
+        if filler.CsvProcessor.individual_key(row) == key:
+            row[12:14] = ["", ""]
+    with open(csv_path, "w", newline="", encoding="utf-8-sig") as f:
+        csv.writer(f).writerows(rows)
+    return key
+
+
+def test_kept_letter_with_insufficient_data_is_expected(tmp_path):
+    letter_benchmark.make_template(tmp_path / "template.docx")
+    letter_benchmark.make_csv(tmp_path / "aggregated_output.csv", people=3)
+    stage = filler.load_stage("stage", tmp_path, "template.docx", "aggregated_output.csv")
+    stage["output_folder"].mkdir()
+    letter_generator = filler.LetterGenerator(stage["template_path"])
+    for individual_key, individual_rows in stage["groups"].items():
+        data = stage["csv_processor"].process_individual(individual_key, individual_rows)
+        filler.save_letter(letter_generator, data, "2026-01-01",
+                           stage["output_folder"] / stage["output_names"][individual_key])
+
+    key = blank_address(tmp_path / "aggregated_output.csv")
+    stage = filler.load_stage("stage", tmp_path, "template.docx", "aggregated_output.csv")
+    jobs, missing, unexpected = letter_validator.stage_checks(stage)
+
+    assert missing == []
+    assert unexpected == []
+    assert stage["output_names"][key] not in [job[1] for job in jobs]
+    assert len(jobs) == len(stage["groups"]) - 1
@@ -1,35 +1,120 @@
 import os
 import csv
 import re
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from dotenv import load_dotenv
+from docx import Document
+from docx.opc.constants import CONTENT_TYPE as CT
 from docxtpl import DocxTemplate
+from jinja2 import Environment, TemplateError
+
+from docx_zip import DocxZipWriter
 
 load_dotenv()
 
-CSV_DIR = os.getenv("DIR_UZPILDYTOJAS_XLS")
-DOCX_DIR = os.getenv("DIR_UZPILDYTOJAS_docx")
+# string properties docxtpl renders in docProps/core.xml
+CORE_PROPERTIES = ("author", "comments", "identifier", "language", "subject", "title")
+
+
+class CompiledDocxTemplate(DocxTemplate):
+    """DocxTemplate that is opened, pre-processed and compiled once.
+
+    Every render() reuses the same in-memory document: body, headers, footers, footnotes
+    and core properties are rendered from the sources captured at load time, so nothing
+    from the previous row is left behind. Sources are compiled once per Jinja environment,
+    a jinja_env passed to render() is used like in DocxTemplate.
+    """
+
+    def __init__(self, template_file):
+        super().__init__(template_file)
+        self.init_docx()
+        self.jinja_env = Environment()
+        self.autoescape_env = Environment(autoescape=True)
+        self.compiled = {}
+
+        self.body_xml = self.patch_xml(self.get_xml())
+        self.headers_footers = {}
+        for uri in (self.HEADER_URI, self.FOOTER_URI):
+            self.headers_footers[uri] = []
+            for rel_key, part in self.get_headers_footers(uri):
+                xml = self.get_part_xml(part)
+                encoding = self.get_headers_footers_encoding(xml)
+                self.headers_footers[uri].append((rel_key, encoding, self.patch_xml(xml)))
+
+        package = self.docx.part.package
+        self.footnotes = [
+            (part, self.patch_xml(part.blob.decode("utf-8")))
+            for part in package.parts
+            if part.content_type == CT.WML_FOOTNOTES
+        ]
+        self.properties = {prop: getattr(self.docx.core_properties, prop) for prop in CORE_PROPERTIES}
+        # render() changes these parts in place, headers and footers are replaced by new parts
+        self.changing_parts = [self.docx.part] + [part for part, _ in self.footnotes] + [
+            part for part in package.parts if part.content_type == CT.OPC_CORE_PROPERTIES
+        ]
+
+    def render(self, context, jinja_env=None, autoescape=False):
+        # DocxTemplate creates a new environment for every autoescaped render, which would
+        # defeat the compile cache
+        if autoescape and not jinja_env:
+            jinja_env = self.autoescape_env
+        super().render(context, jinja_env, autoescape)
+
+    def compile(self, source, jinja_env=None):
+        """Compiled template of source in jinja_env (the default environment if None)."""
+        jinja_env = jinja_env or self.jinja_env
+        key = (jinja_env, jinja_env.autoescape, source)
+        template = self.compiled.get(key)
+        if template is None:
+            template = jinja_env.from_string(source)
+            self.compiled[key] = template
+        return template
 
-if not CSV_DIR or not DOCX_DIR:
-    raise SystemExit("Set DIR_UZPILDYTOJAS_XLS and DIR_UZPILDYTOJAS_docx in .env")
+    def init_docx(self, reload=True):
+        # the document is loaded once and reused for every render
+        if not self.docx:
+            self.docx = Document(self.template_file)
+        self.is_rendered = False
 
-csv_dir = Path(CSV_DIR)
-docx_dir = Path(DOCX_DIR)
+    def render_xml_part(self, src_xml, part, context, jinja_env=None):
+        # same as DocxTemplate.render_xml_part, but each source is compiled only once
+        src_xml = re.sub(r"<w:p([ >])", r"\n<w:p\1", src_xml)
+        try:
+            self.current_rendering_part = part
+            dst_xml = self.compile(src_xml, jinja_env).render(context)
+        except TemplateError as exc:
+            if getattr(exc, "lineno", None) is not None:
+                line_number = max(exc.lineno - 4, 0)
+                exc.docx_context = [
+                    re.sub(r"<[^>]+>", "", line)
+                    for line in src_xml.splitlines()[line_number:line_number + 7]
+                ]
+            raise
+        dst_xml = re.sub(r"\n<w:p([ >])", r"<w:p\1", dst_xml)
+        dst_xml = (
+            dst_xml.replace("{_{", "{{")
+            .replace("}_}", "}}")
+            .replace("{_%", "{%")
+            .replace("%_}", "%}")
+        )
+        return self.resolve_listing(dst_xml)
 
-template_path = next(docx_dir.glob("*.docx"), None)
-if not template_path:
-    raise SystemExit("No .docx template found in template dir")
+    def build_xml(self, context, jinja_env=None):
+        return self.render_xml_part(self.body_xml, self.docx._part, context, jinja_env)
 
-# get prefix from template name
-template_stem = template_path.stem
-if "_" in template_stem:
-    template_prefix = template_stem.rsplit("_", 1)[0]
-else:
-    template_prefix = template_stem
+    def build_headers_footers_xml(self, context, uri, jinja_env=None):
+        for rel_key, encoding, xml in self.headers_footers[uri]:
+            part = self.docx._part.rels[rel_key].target_part
+            yield rel_key, self.render_xml_part(xml, part, context, jinja_env).encode(encoding)
 
-csv_files = list(csv_dir.glob("*.csv"))
-if not csv_files:
-    raise SystemExit("No .csv files found in CSV dir")
+    def render_properties(self, context, jinja_env=None):
+        for prop, source in self.properties.items():
+            setattr(self.docx.core_properties, prop, self.compile(source, jinja_env).render(context))
+
+    def render_footnotes(self, context, jinja_env=None):
+        for part, xml in self.footnotes:
+            part._blob = self.render_xml_part(xml, part, context, jinja_env).encode("utf-8")
 
 
 def safe_name(s: str) -> str:
@@ -38,33 +123,153 @@ def safe_name(s: str) -> str:
     return s or "row"
 
 
-for csv_path in csv_files:
-    with csv_path.open("r", encoding="utf-8-sig", newline="") as f:
-        reader = csv.DictReader(f, delimiter=";")
-        print("Detected headers:", reader.fieldnames)
+class NameRegistry:
+    """Hands out unique output names from one directory listing, without probing the disk again.
+
+    Only the main process assigns names, so workers never race for the same file.
+    """
+
+    def __init__(self, directory):
+        # lower-cased: the network share is case-insensitive
+        self.taken = {entry.name.lower() for entry in os.scandir(directory)}
+        self.next_counter = {}
+
+    def claim(self, stem):
+        """Return stem.docx, or the first free stem_1.docx, stem_2.docx, ... and reserve it."""
+        name = f"{stem}.docx"
+        counter = self.next_counter.get(stem, 1)
+        while name.lower() in self.taken:
+            name = f"{stem}_{counter}.docx"
+            counter += 1
+        # every counter below this one is taken for good, the next claim can start here
+        self.next_counter[stem] = counter
+        self.taken.add(name.lower())
+        return name
+
+
+def row_context(row):
+    """Template variables for one CSV row."""
+    return {
+        "Bendras_Nr__1": row.get("Bendras Nr.", "") or "",
+        "Adresas_1": row.get("Adresas", "") or "",
+        "Pavadinimas_1": row.get("Pavadinimas", "") or "",
+    }
+
+
+def template_prefix(template_path):
+    """Output name prefix of a template: its file name without the last _part."""
+    template_stem = template_path.stem
+    if "_" in template_stem:
+        return template_stem.rsplit("_", 1)[0]
+    return template_stem
+
+
+# each process compiles every template once and keeps them for all of its rows
+_worker_templates = []
+
+
+def init_worker(template_paths):
+    """Load and compile the templates for this process."""
+    _worker_templates.clear()
+    for template_path in template_paths:
+        doc = CompiledDocxTemplate(str(template_path))
+        # unchanged template parts are copied into every output as already-compressed bytes
+        zip_writer = DocxZipWriter(template_path, doc.docx.part.package, doc.changing_parts)
+        _worker_templates.append((doc, zip_writer))
+
+
+def render_row(job):
+    """Render one (template index, csv name, row number, context, output path) job, reporting errors instead of raising."""
+    template_index, csv_name, row_number, context, out_path = job
+    result = {"template": template_index, "csv": csv_name, "row": row_number, "path": out_path, "error": None}
+    try:
+        doc, zip_writer = _worker_templates[template_index]
+        doc.render(context)
+        zip_writer.write(out_path, doc.docx.part.package)
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    return result
+
+
+def report(results):
+    """Print every result as it arrives and return them all."""
+    collected = []
+    for result in results:
+        if result["error"]:
+            print(f"Error in {result['csv']} row {result['row']} ({result['path'].name}): {result['error']}")
+        else:
+            print("Saved:", result["path"])
+        collected.append(result)
+    return collected
+
+
+def main():
+    CSV_DIR = os.getenv("DIR_UZPILDYTOJAS_XLS")
+    DOCX_DIR = os.getenv("DIR_UZPILDYTOJAS_docx")
+    # worker processes for rendering (1 = sequential, 0 = one per CPU)
+    workers = int(os.getenv("UZPILDYTOJAS_WORKERS", "1")) or os.cpu_count()
+
+    if not CSV_DIR or not DOCX_DIR:
+        raise SystemExit("Set DIR_UZPILDYTOJAS_XLS and DIR_UZPILDYTOJAS_docx in .env")
+
+    csv_dir = Path(CSV_DIR)
+    docx_dir = Path(DOCX_DIR)
+
+    # every template in the folder is filled for every row (~$ files are Word lock files)
+    template_paths = sorted(path for path in docx_dir.glob("*.docx") if not path.name.startswith("~$"))
+    if not template_paths:
+        raise SystemExit("No .docx template found in template dir")
+
+    csv_files = sorted(csv_dir.glob("*.csv"))
+    if not csv_files:
+        raise SystemExit("No .csv files found in CSV dir")
+
+    # with several templates, output goes into one folder per template prefix
+    prefixes = [template_prefix(template_path) for template_path in template_paths]
+    out_dirs = [csv_dir / prefix if len(template_paths) > 1 else csv_dir for prefix in prefixes]
+    registries = {}
+    for out_dir in out_dirs:
+        out_dir.mkdir(exist_ok=True)
+        if out_dir not in registries:
+            registries[out_dir] = NameRegistry(out_dir)
+
+    # names are assigned here, in CSV and row order, so they do not depend on which worker renders a row
+    jobs = []
+    for csv_path in csv_files:
+        with csv_path.open("r", encoding="utf-8-sig", newline="") as f:
+            reader = csv.DictReader(f, delimiter=";")
+            print("Detected headers:", reader.fieldnames)
 
-        for i, row in enumerate(reader, start=1):
-            # fill docx
-            context = {
-                "Bendras_Nr__1": row.get("Bendras Nr.", "") or "",
-                "Adresas_1": row.get("Adresas", "") or "",
-                "Pavadinimas_1": row.get("Pavadinimas", "") or "",
-            }
+            for i, row in enumerate(reader, start=1):
+                # 📛 filename: use Bendras Nr. (this is your VE29_M64)
+                code = row.get("Bendras Nr.", "") or f"row_{i}"
+                code = safe_name(code)
+                context = row_context(row)
 
-            doc = DocxTemplate(str(template_path))
-            doc.render(context)
+                for template_index, (prefix, out_dir) in enumerate(zip(prefixes, out_dirs)):
+                    out_path = out_dir / registries[out_dir].claim(f"{prefix}_{code}")
+                    jobs.append((template_index, csv_path.name, i, context, out_path))
 
-            # 📛 filename: use Bendras Nr. (this is your VE29_M64)
-            code = row.get("Bendras Nr.", "") or f"row_{i}"
-            code = safe_name(code)
+    print(f"Templates: {', '.join(template_path.name for template_path in template_paths)}")
+    if workers > 1 and len(jobs) > 1:
+        print(f"Rendering {len(jobs)} documents with {workers} worker processes")
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(template_paths,)) as executor:
+            chunksize = max(1, len(jobs) // (workers * 8))
+            results = report(executor.map(render_row, jobs, chunksize=chunksize))
+    else:
+        init_worker(template_paths)
+        results = report(map(render_row, jobs))
 
-            final_name = f"{template_prefix}_{code}.docx"
-            out_path = csv_dir / final_name
+    print("\nSummary:")
+    for template_index, template_path in enumerate(template_paths):
+        template_results = [result for result in results if result["template"] == template_index]
+        failed = sum(1 for result in template_results if result["error"])
+        print(f"  {template_path.name}: {len(template_results) - failed} saved, {failed} failed -> {out_dirs[template_index]}")
 
-            counter = 1
-            while out_path.exists():
-                out_path = csv_dir / f"{template_prefix}_{code}_{counter}.docx"
-                counter += 1
+    errors = [result for result in results if result["error"]]
+    print(f"\nSaved {len(results) - len(errors)} documents, {len(errors)} rows failed")
+    for result in errors:
+        print(f"  {result['csv']} row {result['row']} ({result['path'].name}): {result['error']}")
 
-            doc.save(out_path)
-            print("Saved:", out_path)
+if __name__ == "__main__":
+    main()